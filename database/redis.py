@@ -88,6 +88,24 @@ options:
             - A redis config value.
         required: false
         default: null
+    config:
+        version_added: "1.9"
+        description:
+            - A hash of redis config keys and values to ensure at once
+              [config command]. Current values are read with a single
+              C(CONFIG GET *) and all needed changes are sent in one
+              pipelined round trip. May be combined with I(name)/I(value).
+        required: false
+        default: null
+    config_rewrite:
+        version_added: "1.9"
+        description:
+            - Run C(CONFIG REWRITE) after changing settings, so they are
+              kept in the instance's config file across restarts
+              [config command].
+        required: false
+        default: no
+        choices: [ "yes", "no" ]
 
 
 notes:
@@ -119,8 +137,20 @@ EXAMPLES = '''
 
 # Configure local redis to have lua time limit of 100 ms
 - redis: command=config name=lua-time-limit value=100
+
+# Configure several settings at once and save them to redis.conf
+- redis:
+    command: config
+    config_rewrite: yes
+    config:
+      maxclients: 10000
+      maxmemory: 1gb
+      maxmemory-policy: allkeys-lru
+      appendonly: yes
 '''
 
+import re
+
 try:
     import redis
 except ImportError:
@@ -158,6 +188,41 @@ def flush(client, db=None):
         return False
 
 
+MEMORY_UNITS = {'k': 1000, 'kb': 1024, 'm': 1000 ** 2, 'mb': 1024 ** 2,
+                'g': 1000 ** 3, 'gb': 1024 ** 3}
+
+def config_value(value):
+    """ Render a config value the way CONFIG GET reports it. """
+    if isinstance(value, bool):
+        return value and 'yes' or 'no'
+    value = str(value)
+    # memory sizes are read back in bytes
+    m = re.match(r'^(\d+)(k|kb|m|mb|g|gb)$', value.lower())
+    if m:
+        return str(int(m.group(1)) * MEMORY_UNITS[m.group(2)])
+    return value
+
+
+def set_config(client, changes, rewrite=False):
+    """ Send every CONFIG SET (and a CONFIG REWRITE) in one round trip.
+
+    Returns a dict of the keys that could not be set and their errors,
+    with the rewrite error under None.
+    """
+    pipe = client.pipeline(transaction=False)
+    names = sorted(changes)
+    for name in names:
+        pipe.config_set(name, changes[name])
+    if rewrite:
+        pipe.execute_command('CONFIG REWRITE')
+        names.append(None)
+    errors = {}
+    for name, reply in zip(names, pipe.execute(raise_on_error=False)):
+        if isinstance(reply, Exception):
+            errors[name] = str(reply)
+    return errors
+
+
 # ===========================================
 # Module execution.
 #
@@ -175,7 +240,9 @@ def main():
             db=dict(default=None),
             flush_mode=dict(default='all', choices=['all', 'db']),
             name=dict(default=None),
-            value=dict(default=None)
+            value=dict(default=None),
+            config=dict(default=None, type='dict'),
+            config_rewrite=dict(default=False, type='bool')
         ),
         supports_check_mode = True
     )
@@ -296,31 +363,46 @@ def main():
     elif command == 'config':
         name = module.params['name']
         value = module.params['value']
+        config = dict(module.params['config'] or {})
+        if name:
+            config[name] = value
+        if not config:
+            module.fail_json(msg="name or config must be provided")
+        config = dict((k, config_value(v)) for k, v in config.items())
 
         r = redis.StrictRedis(host=login_host,
                               port=login_port,
                               password=login_password)
 
+        # the CONFIG GET doubles as the connection check
         try:
-            r.ping()
-        except Exception, e:
+            current = r.config_get('*')
+        except redis.ConnectionError, e:
             module.fail_json(msg="unable to connect to database: %s" % e)
-
-        
-        try:
-            old_value = r.config_get(name)[name]
         except Exception, e:
             module.fail_json(msg="unable to read config: %s" % e)
-        changed = old_value != value
+
+        changes = dict((k, v) for k, v in config.items() if current.get(k) != v)
+        changed = bool(changes)
+        result = dict(changed=changed, config=config,
+                      changes=dict((k, dict(before=current.get(k), after=v))
+                                   for k, v in changes.items()))
+        if name:
+            result.update(name=name, value=value)
 
         if module.check_mode or not changed:
-            module.exit_json(changed=changed, name=name, value=value)
+            module.exit_json(**result)
         else:
             try:
-                r.config_set(name, value)
+                errors = set_config(r, changes, module.params['config_rewrite'])
             except Exception, e:
                 module.fail_json(msg="unable to write config: %s" % e)
-            module.exit_json(changed=changed, name=name, value=value)
+            if None in errors:
+                module.fail_json(msg="unable to rewrite config file: %s" % errors.pop(None), **result)
+            if errors:
+                module.fail_json(msg="unable to write config: %s" %
+                                 ', '.join('%s (%s)' % e for e in sorted(errors.items())), **result)
+            module.exit_json(**result)
     else:
         module.fail_json(msg='A valid command must be provided')
 
@@ -52,6 +52,16 @@ options:
     required: false
     default: riak@127.0.0.1
     aliases: []
+  join_nodes:
+    description:
+      - Nodes joining the cluster together. Each of them must stage its own
+        join (C(command=join)); this waits until all of them have, runs one
+        C(riak-admin cluster plan), checks that it only holds those joins and
+        commits it once, so the ring is rebalanced a single time. Combine
+        with I(wait_for_handoffs) to wait for the resulting transfers.
+    required: false
+    default: null
+    version_added: "1.9"
   wait_for_handoffs:
     description:
       - Number of seconds to wait for handoffs to complete.
@@ -81,20 +91,54 @@ options:
     default: 'yes'
     choices: ['yes', 'no']
     version_added: 1.5.1
+  poll_interval:
+    description:
+      - Longest pause, in seconds, between two checks while waiting for the
+        stats endpoint, handoffs or the ring. Checks start a quarter of a
+        second apart and back off exponentially up to this value.
+    required: false
+    default: 10
+    version_added: "1.9"
+  stats_keys:
+    description:
+      - Names of entries of the node's C(/stats) document to return as the
+        C(riak_stats) fact. Only these entries are kept.
+    required: false
+    default: null
+    version_added: "1.9"
+notes:
+  - Stats are read over one keep-alive HTTP connection to I(http_conn).
+    Ring readiness is first checked from those stats (every ring member
+    connected, all partitions owned); C(riak-admin ringready) is only run
+    once they look ready, or when the stats lack the needed entries.
+  - Riak does not publish pending handoffs over HTTP, so I(wait_for_handoffs)
+    still polls C(riak-admin transfers). Its output is returned parsed in
+    C(transfers).
 '''
 
 EXAMPLES = '''
 # Join's a Riak node to another node
 - riak: command=join target_node=riak@10.1.1.1
 
+# Stage joins on new nodes, then commit them all at once from the
+# first one and wait for the rebalance
+- riak: command=join target_node=riak@10.1.1.1
+- riak: join_nodes=riak@10.1.1.5,riak@10.1.1.6,riak@10.1.1.7 wait_for_handoffs=3600
+  run_once: true
+
 # Wait for handoffs to finish.  Use with async and poll.
 - riak: wait_for_handoffs=yes
 
 # Wait for riak_kv service to startup
 - riak: wait_for_service=kv
+
+# Collect a few stats as facts
+- riak: stats_keys=node_gets,node_puts,vnode_index_reads
 '''
 
 import urllib2
+import httplib
+import re
 import time
 import socket
 import sys
@@ -104,7 +148,82 @@ except ImportError:
     import simplejson as json
 
 
-def ring_check(module, riak_admin_bin):
+def backoff(ceiling, start=0.25):
+    """ Yield pauses doubling from start up to ceiling. """
+    delay = start
+    while True:
+        yield min(delay, ceiling)
+        delay = min(delay * 2, ceiling)
+
+class RiakHTTP(object):
+    """ Keep-alive connection to the node's HTTP interface. """
+
+    def __init__(self, http_conn, timeout=5):
+        host, _, port = http_conn.partition(':')
+        self.host = host
+        self.port = int(port or 8098)
+        self.timeout = timeout
+        self.conn = None
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    def get(self, path):
+        # a kept-alive connection may have been dropped by the node,
+        # so retry once on a fresh one before giving up
+        for attempt in (1, 2):
+            if self.conn is None:
+                self.conn = httplib.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            try:
+                self.conn.request('GET', path, headers={'Accept': 'application/json'})
+                response = self.conn.getresponse()
+                return response.status, response.read()
+            except (httplib.HTTPException, socket.error):
+                self.close()
+                if attempt == 2:
+                    raise
+
+    def stats(self):
+        """ Parsed /stats, or None if the node did not answer. """
+        try:
+            status, body = self.get('/stats')
+        except (httplib.HTTPException, socket.error):
+            return None
+        if status != 200:
+            return None
+        return json.loads(body)
+
+def ring_ownership(stats):
+    """ {node: partitions} from the ring_ownership stat, None if absent. """
+    raw = stats.get('ring_ownership')
+    if not raw:
+        return None
+    return dict((node, int(count)) for node, count in
+                re.findall(r"\{'([^']+)',(\d+)\}", raw))
+
+def ring_stats_ready(stats):
+    """ Whether /stats allow the ring to be ready; None if they can't tell.
+
+    This can only rule readiness out: all members being connected and all
+    partitions being owned does not mean every node has the same ring.
+    """
+    members = stats.get('ring_members')
+    owned = ring_ownership(stats)
+    if members is None or owned is None or 'connected_nodes' not in stats:
+        return None
+    up = set(stats['connected_nodes'])
+    up.add(stats.get('nodename'))
+    if not set(members) <= up:
+        return False
+    return sum(owned.values()) == stats.get('ring_num_partitions', sum(owned.values()))
+
+def ring_check(module, riak_admin_bin, http=None):
+    if http is not None:
+        stats = http.stats()
+        if stats is not None and ring_stats_ready(stats) is False:
+            return False
     cmd = '%s ringready' % riak_admin_bin
     rc, out, err = module.run_command(cmd)
     if rc == 0 and 'TRUE All nodes agree on the ring' in out:
@@ -112,6 +231,21 @@ def ring_check(module, riak_admin_bin):
     else:
         return False
 
+def parse_plan(out):
+    """ Staged (action, node) pairs from riak-admin cluster plan output. """
+    return re.findall(r"^(join|leave|force-remove|replace|force-replace)\s+'([^']+)'", out, re.M)
+
+def parse_transfers(out):
+    """ Pending and active transfers from riak-admin transfers output. """
+    transfers = dict(waiting={}, down={}, active=0)
+    for node, count in re.findall(r"'([^']+)' waiting to handoff (\d+) partitions", out):
+        transfers['waiting'][node] = int(count)
+    for node, count in re.findall(r"'([^']+)' does not have (\d+) primary partitions running", out):
+        transfers['down'][node] = int(count)
+    transfers['active'] = len(re.findall(r'^\s*transfer type:', out, re.M))
+    transfers['done'] = 'No transfers active' in out
+    return transfers
+
 def main():
 
     module = AnsibleModule(
@@ -125,7 +259,11 @@ def main():
         wait_for_ring=dict(default=False, type='int'),
         wait_for_service=dict(
             required=False, default=None, choices=['kv']),
-        validate_certs = dict(default='yes', type='bool'))
+        validate_certs = dict(default='yes', type='bool'),
+        poll_interval=dict(default=10, type='int'),
+        stats_keys=dict(required=False, default=None, type='list'),
+        join_nodes=dict(required=False, default=None, type='list')),
+        mutually_exclusive=[['command', 'join_nodes']]
     )
 
 
@@ -137,31 +275,37 @@ def main():
     wait_for_ring = module.params.get('wait_for_ring')
     wait_for_service = module.params.get('wait_for_service')
     validate_certs =  module.params.get('validate_certs')
+    poll_interval = module.params.get('poll_interval')
+    stats_keys = module.params.get('stats_keys')
+    join_nodes = module.params.get('join_nodes')
 
 
     #make sure riak commands are on the path
     riak_bin = module.get_bin_path('riak')
     riak_admin_bin = module.get_bin_path('riak-admin')
 
+    http = RiakHTTP(http_conn)
     timeout = time.time() + 120
+    delays = backoff(poll_interval)
     while True:
         if time.time() > timeout:
             module.fail_json(msg='Timeout, could not fetch Riak stats.')
-        (response, info) = fetch_url(module, 'http://%s/stats' % (http_conn), force=True, timeout=5)
-        if info['status'] == 200:
-            stats_raw = response.read()
+        # here we attempt to load those stats,
+        try:
+            stats = http.stats()
+        except ValueError:
+            module.fail_json(msg='Could not parse Riak stats.')
+        if stats is not None:
             break
-        time.sleep(5)
-
-    # here we attempt to load those stats,
-    try:
-        stats = json.loads(stats_raw)
-    except:
-        module.fail_json(msg='Could not parse Riak stats.')
+        time.sleep(next(delays))
 
     node_name = stats['nodename']
     nodes = stats['ring_members']
     ring_size = stats['ring_creation_size']
+    if stats_keys:
+        riak_stats = dict([(k, stats.get(k)) for k in stats_keys])
+    # don't hold on to the whole document
+    del stats
     rc, out, err = module.run_command([riak_bin, 'version'] )
     version = out.strip()
     
@@ -217,18 +361,55 @@ def main():
         else:
             module.fail_json(msg=out)
 
+    if join_nodes:
+        # a staged join shows up in ring_members before it is committed
+        timeout = time.time() + 120
+        delays = backoff(poll_interval)
+        while True:
+            missing = [n for n in join_nodes if n not in nodes]
+            if not missing:
+                break
+            if time.time() > timeout:
+                module.fail_json(msg='Timeout waiting for %s to stage a join.' % ', '.join(missing))
+            time.sleep(next(delays))
+            current = http.stats()
+            if current is not None:
+                nodes = result['nodes'] = current['ring_members']
+
+        cmd = '%s cluster plan' % riak_admin_bin
+        rc, out, err = module.run_command(cmd)
+        if rc != 0:
+            module.fail_json(msg=out)
+        result['plan'] = out
+        staged = parse_plan(out)
+        unexpected = ["%s '%s'" % change for change in staged
+                      if change[0] != 'join' or change[1] not in join_nodes]
+        if unexpected:
+            module.fail_json(msg='Plan holds changes besides the requested joins: %s' % ', '.join(unexpected),
+                             plan=out)
+        result['joined'] = [node for action, node in staged]
+        if staged:
+            cmd = '%s cluster commit' % riak_admin_bin
+            rc, out, err = module.run_command(cmd)
+            if rc != 0:
+                module.fail_json(msg=out)
+            result['commit'] = out
+            result['changed'] = True
+
 # this could take a while, recommend to run in async mode
     if wait_for_handoffs:
         timeout = time.time() + wait_for_handoffs
+        delays = backoff(poll_interval)
         while True:
             cmd = '%s transfers' % riak_admin_bin
             rc, out, err = module.run_command(cmd)
-            if 'No transfers active' in out:
+            result['transfers'] = parse_transfers(out)
+            if result['transfers']['done']:
                 result['handoffs'] = 'No transfers active.'
                 break
-            time.sleep(10)
             if time.time() > timeout:
-                module.fail_json(msg='Timeout waiting for handoffs.')
+                module.fail_json(msg='Timeout waiting for handoffs.', transfers=result['transfers'])
+            time.sleep(min(next(delays), max(0, timeout - time.time())))
 
     if wait_for_service:
         cmd = [riak_admin_bin, 'wait_for_service', 'riak_%s' % wait_for_service, node_name ]
@@ -237,14 +418,19 @@ def main():
 
     if wait_for_ring:
         timeout = time.time() + wait_for_ring
+        delays = backoff(poll_interval)
         while True:
-            if ring_check(module, riak_admin_bin):
+            if ring_check(module, riak_admin_bin, http):
                 break
-            time.sleep(10)
-        if time.time() > timeout:
-            module.fail_json(msg='Timeout waiting for nodes to agree on ring.')
-
-    result['ring_ready'] = ring_check(module, riak_admin_bin)
+            if time.time() > timeout:
+                module.fail_json(msg='Timeout waiting for nodes to agree on ring.')
+            time.sleep(min(next(delays), max(0, timeout - time.time())))
+        result['ring_ready'] = True
+    else:
+        result['ring_ready'] = ring_check(module, riak_admin_bin, http)
+    http.close()
+    if stats_keys:
+        result['ansible_facts'] = dict(riak_stats=riak_stats)
 
     module.exit_json(**result)
 
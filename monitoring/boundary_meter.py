@@ -26,6 +26,14 @@ import json
 import datetime
 import base64
 import os
+import tempfile
+import threading
+import urllib2
+
+try:
+    import ssl
+except ImportError:
+    ssl = None
 
 DOCUMENTATION = '''
 
@@ -54,10 +62,12 @@ options:
         description:
             - Organizations boundary API ID
         required: true
+        aliases: [ "api_id" ]
     apikey:
         description:
             - Organizations boundary API KEY
         required: true
+        aliases: [ "api_key" ]
     validate_certs:
         description:
             - If C(no), SSL certificates will not be validated. This should only be used
@@ -69,6 +79,11 @@ options:
 
 notes:
     - This module does not yet support boundary tags.
+    - The meter is looked up once per run and the key and certificate
+      files are downloaded in parallel and written atomically. Python
+      older than 2.7.9 can only validate certificates through Ansible's
+      own HTTP helper, so there, unless I(validate_certs=no), the files are
+      downloaded one after the other.
 
 '''
 
@@ -84,6 +99,9 @@ EXAMPLES='''
 api_host = "api.boundary.com"
 config_directory = "/etc/bprobe"
 
+# search results per (apiid, name), so one run asks the api host only once
+meter_cache = {}
+
 # "resource" like thing or apikey?
 def auth_encode(apikey):
     auth = base64.standard_b64encode(apikey)
@@ -102,7 +120,7 @@ def build_url(name, apiid, action, meter_id=None, cert_type=None):
     elif action == "delete":
         return  "https://%s/%s/meters/%s" % (api_host, apiid, meter_id)
 
-def http_request(module, name, apiid, apikey, action, data=None, meter_id=None, cert_type=None):
+def http_request(module, name, apiid, apikey, action, data=None, meter_id=None, cert_type=None, method=None):
     
     if meter_id is None:
         url = build_url(name, apiid, action)
@@ -116,7 +134,7 @@ def http_request(module, name, apiid, apikey, action, data=None, meter_id=None,
     headers["Authorization"] = "Basic %s" % auth_encode(apikey)
     headers["Content-Type"] = "application/json"
 
-    return fetch_url(module, url, data=data, headers=headers)
+    return fetch_url(module, url, data=data, headers=headers, method=method)
 
 def create_meter(module, name, apiid, apikey):
 
@@ -141,29 +159,55 @@ def create_meter(module, name, apiid, apikey):
                 module.fail_json("Could not create " + config_directory)
 
 
-        # Download both cert files from the api host
-        types = ['key', 'cert']
-        for cert_type in types:
-            try:
-                # If we can't open the file it's not there, so we should download it
-                cert_file = open('%s/%s.pem' % (config_directory,cert_type))
-            except IOError:
-                # Now download the file...
-                rc = download_request(module, name, apiid, apikey, cert_type)
-                if rc == False:
-                    module.fail_json("Download request for " + cert_type + ".pem failed")
+        # Remember the new meter; the Location header ends with its id
+        location = (info.get('location') or '').rstrip('/')
+        if '/meters/' in location:
+            meter_cache[(apiid, name)] = [{'id': location.rsplit('/', 1)[-1], 'name': name}]
+        else:
+            meter_cache.pop((apiid, name), None)
+
+        # Download the cert files we don't have yet from the api host, in parallel
+        types = [cert_type for cert_type in ['key', 'cert']
+                 if not os.path.exists('%s/%s.pem' % (config_directory, cert_type))]
+        if types:
+            meter_id = get_meter_id(module, name, apiid, apikey)
+            if meter_id is None:
+                module.fail_json(msg="Could not get meter id")
+
+            errors = dict((cert_type, "Download request for " + cert_type + ".pem failed") for cert_type in types)
+            context = ssl_context(module)
+            def download(cert_type):
+                errors[cert_type] = download_request(module, name, apiid, apikey, cert_type, meter_id, context)
+
+            if context is False:
+                for cert_type in types:
+                    download(cert_type)
+            else:
+                threads = [threading.Thread(target=download, args=(cert_type,)) for cert_type in types]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+
+            for cert_type in types:
+                if errors[cert_type]:
+                    module.fail_json(msg=errors[cert_type])
 
         return 0, "Meter " + name + " created"
 
 def search_meter(module, name, apiid, apikey):
 
+    if (apiid, name) in meter_cache:
+        return meter_cache[(apiid, name)]
+
     response, info = http_request(module, name, apiid, apikey, action="search")
 
     if info['status'] != 200:
         module.fail_json("Failed to connect to api host to search for meter")
 
     # Return meters
-    return json.loads(response.read())
+    meter_cache[(apiid, name)] = json.loads(response.read())
+    return meter_cache[(apiid, name)]
 
 def get_meter_id(module, name, apiid, apikey):
     # In order to delete the meter we need its id
@@ -181,9 +225,10 @@ def delete_meter(module, name, apiid, apikey):
     if meter_id is None:
         return 1, "Meter does not exist, so can't delete it"
     else:
-        response, info = http_request(module, name, apiid, apikey, action, meter_id)
+        response, info = http_request(module, name, apiid, apikey, "delete", meter_id=meter_id, method="DELETE")
         if info['status'] != 200:
             module.fail_json("Failed to delete meter")
+        meter_cache.pop((apiid, name), None)
 
         # Each new meter gets a new key.pem and ca.pem file, so they should be deleted
         types = ['cert', 'key']
@@ -196,30 +241,59 @@ def delete_meter(module, name, apiid, apikey):
 
     return 0, "Meter " + name + " deleted"
 
-def download_request(module, name, apiid, apikey, cert_type):
-
-    meter_id = get_meter_id(module, name, apiid, apikey)
-
-    if meter_id is not None:
-        action = "certificates"
-        response, info = http_request(module, name, apiid, apikey, action, meter_id, cert_type)
+def ssl_context(module):
+    """ Context for urllib2 in the download threads; False when this python
+    can't validate certificates there (before 2.7.9) but must. """
+    if module.params['validate_certs']:
+        if hasattr(ssl, 'create_default_context'):
+            return ssl.create_default_context()
+        return False
+    if hasattr(ssl, '_create_unverified_context'):
+        return ssl._create_unverified_context()
+    return None
+
+def download_request(module, name, apiid, apikey, cert_type, meter_id, context=False):
+    """ Download one cert file; returns an error message or None.
+    Unless context is False it runs in a worker thread, and goes through
+    urllib2: fetch_url may call fail_json, which would print a second
+    result from the thread. """
+
+    action = "certificates"
+    if context is False:
+        response, info = http_request(module, name, apiid, apikey, action, meter_id=meter_id, cert_type=cert_type)
         if info['status'] != 200:
-            module.fail_json("Failed to connect to api host to download certificate")
-
-        if result:
-            try:
-                cert_file_path = '%s/%s.pem' % (config_directory,cert_type)
-                body = response.read()
-                cert_file = open(cert_file_path, 'w')
-                cert_file.write(body)
-                cert_file.close
-                os.chmod(cert_file_path, 0o600)
-            except: 
-                module.fail_json("Could not write to certificate file")
-
-        return True
+            return "Failed to connect to api host to download certificate"
     else:
-        module.fail_json("Could not get meter id")
+        url = build_url(name, apiid, action, meter_id, cert_type)
+        request = urllib2.Request(url, headers={"Authorization": "Basic %s" % auth_encode(apikey)})
+        try:
+            if context is None:
+                response = urllib2.urlopen(request)
+            else:
+                response = urllib2.urlopen(request, context=context)
+        except Exception:
+            return "Failed to connect to api host to download certificate"
+        if response.getcode() != 200:
+            return "Failed to connect to api host to download certificate"
+
+    cert_file_path = '%s/%s.pem' % (config_directory,cert_type)
+    try:
+        body = response.read()
+        # write next to the target and rename, so bprobe never sees half a file
+        fd, tmp_path = tempfile.mkstemp(prefix='.%s.pem' % cert_type, dir=config_directory)
+        try:
+            cert_file = os.fdopen(fd, 'w')
+            cert_file.write(body)
+            cert_file.close()
+            os.chmod(tmp_path, 0o600)
+            os.rename(tmp_path, cert_file_path)
+        except:
+            os.remove(tmp_path)
+            raise
+    except:
+        return "Could not write to certificate file"
+
+    return None
 
 def main():
 
@@ -227,16 +301,16 @@ def main():
         argument_spec=dict(
         state=dict(required=True, choices=['present', 'absent']),
         name=dict(required=False),
-        apikey=dict(required=True),
-        apiid=dict(required=True),
+        apikey=dict(required=True, aliases=['api_key']),
+        apiid=dict(required=True, aliases=['api_id']),
         validate_certs = dict(default='yes', type='bool'),
         )
     )
 
     state = module.params['state']
     name= module.params['name']
-    apikey = module.params['api_key']
-    apiid = module.params['api_id']
+    apikey = module.params['apikey']
+    apiid = module.params['apiid']
 
     if state == "present":
         (rc, result) = create_meter(module, name, apiid, apikey)
@@ -23,12 +23,12 @@ options:
         required: true
         default: null
     title:
-        description: ["The event title."]
-        required: true
+        description: ["The event title. Not needed when only flushing the spool."]
+        required: false
         default: null
     text:
-        description: ["The body of the event."]
-        required: true
+        description: ["The body of the event. Not needed when only flushing the spool."]
+        required: false
         default: null
     date_happened:
         description:
@@ -62,12 +62,48 @@ options:
         default: 'yes'
         choices: ['yes', 'no']
         version_added: 1.5.1
+    spool:
+        description:
+            - Directory to queue the event in instead of posting it right away.
+              The task then only writes a local file and never waits on, or
+              fails because of, the DataDog API. Queued events are sent by a
+              task with I(flush=yes).
+        required: false
+        default: null
+        version_added: "1.9"
+    flush:
+        description:
+            - Send every event queued in I(spool) over one keep-alive
+              connection and remove the ones DataDog accepted. Can be run
+              in the background with C(async) at the end of a play.
+            - Events DataDog refuses as invalid (HTTP 400, 413, 422) are
+              renamed to C(.rejected) so they are not sent again. A refused
+              I(api_key) (401, 403) stops the flush and keeps the queue;
+              throttling (429) and server errors are retried.
+        required: false
+        default: 'no'
+        choices: ['yes', 'no']
+        version_added: "1.9"
+    retries:
+        description:
+            - How many times each queued event is retried, with an
+              exponential backoff, when flushing.
+        required: false
+        default: 3
+        version_added: "1.9"
 '''
 
 EXAMPLES = '''
 # Post an event with low priority
 datadog_event: title="Testing from ansible" text="Test!" priority="low"
                api_key="6873258723457823548234234234"
+# Queue a deploy event locally, the play does not wait on the API
+datadog_event: title="Deployed" text="Release 42" api_key="6873258723457823548234234234"
+               spool=/var/spool/ansible-datadog
+# Send all queued events in the background at the end of the play
+datadog_event: api_key="6873258723457823548234234234" spool=/var/spool/ansible-datadog flush=yes
+  async: 300
+  poll: 0
 # Post an event with several tags
 datadog_event: title="Testing from ansible" text="Test!"
                api_key="6873258723457823548234234234"
@@ -75,13 +111,35 @@ datadog_event: title="Testing from ansible" text="Test!"
 '''
 
 import socket
+import os
+import time
+import random
+import tempfile
+import httplib
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+try:
+    import ssl
+except ImportError:
+    ssl = None
+
+API_HOST = "app.datadoghq.com"
+
+# the event itself was refused, sending it again won't help
+REJECTED = (400, 413, 422)
+# the api_key was refused, no event will get through
+UNAUTHORIZED = (401, 403)
 
 def main():
     module = AnsibleModule(
         argument_spec=dict(
             api_key=dict(required=True),
-            title=dict(required=True),
-            text=dict(required=True),
+            title=dict(required=False, default=None),
+            text=dict(required=False, default=None),
             date_happened=dict(required=False, default=None, type='int'),
             priority=dict(
                 required=False, default='normal', choices=['normal', 'low']
@@ -99,14 +157,37 @@ def main():
                          'capistrano']
             ),
             validate_certs = dict(default='yes', type='bool'),
+            spool=dict(required=False, default=None),
+            flush=dict(required=False, default='no', type='bool'),
+            retries=dict(required=False, default=3, type='int'),
         )
     )
 
-    post_event(module)
+    has_event = module.params['title'] is not None or module.params['text'] is not None
+    if has_event and (module.params['title'] is None or module.params['text'] is None):
+        module.fail_json(msg="title and text are required to post an event")
+    if module.params['flush'] and not module.params['spool']:
+        module.fail_json(msg="flush requires a spool directory")
+    if not has_event and not module.params['flush']:
+        module.fail_json(msg="title and text are required to post an event")
 
-def post_event(module):
-    uri = "https://app.datadoghq.com/api/v1/events?api_key=%s" % module.params['api_key']
+    if module.params['spool']:
+        spooled = None
+        if has_event:
+            spooled = spool_event(module, build_event(module))
+        if not module.params['flush']:
+            module.exit_json(changed=True, spooled=spooled)
+        sent, failed, error = flush_spool(module)
+        if error:
+            module.fail_json(msg=error, sent=sent, failed=failed)
+        if failed:
+            module.fail_json(msg="failed to send %d queued event(s)" % len(failed),
+                             sent=sent, failed=failed)
+        module.exit_json(changed=bool(sent or spooled), spooled=spooled, sent=sent)
 
+    post_event(module)
+
+def build_event(module):
     body = dict(
         title=module.params['title'],
         text=module.params['text'],
@@ -121,7 +202,145 @@ def post_event(module):
         body['aggregation_key'] = module.params['aggregation_key']
     if module.params['source_type_name'] != None:
         body['source_type_name'] = module.params['source_type_name']
+    return body
+
+def spool_event(module, body):
+    """ Queue the event as one file in the spool directory. """
+    spool = module.params['spool']
+    # keep the time of the task, not of the flush
+    body.setdefault('date_happened', int(time.time()))
+    try:
+        if not os.path.isdir(spool):
+            os.makedirs(spool, 0o700)
+        fd, tmp = tempfile.mkstemp(prefix='.event', dir=spool)
+        f = os.fdopen(fd, 'w')
+        try:
+            f.write(module.jsonify(body))
+        finally:
+            f.close()
+        # events are sent in order of their file names
+        path = os.path.join(spool, '%.6f-%s.json' % (time.time(), os.path.basename(tmp)[6:]))
+        os.rename(tmp, path)
+    except (IOError, OSError), e:
+        module.fail_json(msg="failed to spool event: %s" % e)
+    return path
+
+class EventSender(object):
+    """ Posts events over one keep-alive connection. httplib only checks
+    certificates from python 2.7.9 on; before that, when they must be
+    validated, each event goes through fetch_url instead, which does. """
+
+    def __init__(self, module):
+        self.module = module
+        self.uri = "/api/v1/events?api_key=%s" % module.params['api_key']
+        self.conn = None
+        self.context = None
+        self.keep_alive = True
+        if module.params['validate_certs']:
+            if hasattr(ssl, 'create_default_context'):
+                self.context = ssl.create_default_context()
+            else:
+                self.keep_alive = False
+        elif hasattr(ssl, '_create_unverified_context'):
+            self.context = ssl._create_unverified_context()
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    def post(self, body):
+        """ Returns the HTTP status, or None if no answer came back. """
+        headers = {"Content-Type": "application/json"}
+        if not self.keep_alive:
+            (response, info) = fetch_url(self.module, "https://%s%s" % (API_HOST, self.uri),
+                                         data=body, headers=headers)
+            if info['status'] == -1:
+                return None
+            if response:
+                response.read()
+            return info['status']
+
+        if self.conn is None:
+            if self.context is not None:
+                self.conn = httplib.HTTPSConnection(API_HOST, timeout=30, context=self.context)
+            else:
+                self.conn = httplib.HTTPSConnection(API_HOST, timeout=30)
+        headers['Connection'] = 'keep-alive'
+        try:
+            self.conn.request('POST', self.uri, body, headers)
+            response = self.conn.getresponse()
+            response.read()
+            return response.status
+        except (httplib.HTTPException, socket.error):
+            # start over on a fresh connection
+            self.close()
+            return None
+
+def flush_spool(module):
+    """ Send every queued event over one keep-alive connection. Returns
+    the files sent, the files still queued or set aside, and an error
+    message if the flush had to stop. """
+    spool = module.params['spool']
+
+    try:
+        names = sorted(n for n in os.listdir(spool) if n.endswith('.json'))
+    except OSError:
+        names = []
+
+    sent, failed = [], []
+    error = None
+    sender = EventSender(module)
+    for index, name in enumerate(names):
+        path = os.path.join(spool, name)
+        try:
+            f = open(path)
+            try:
+                body = f.read()
+            finally:
+                f.close()
+        except IOError:
+            # taken by a concurrent flush
+            continue
+
+        for attempt in range(module.params['retries'] + 1):
+            if attempt:
+                time.sleep(random.uniform(0, min(30, 2 ** attempt)))
+            # no answer, throttling (429) and server errors are retried
+            status = sender.post(body)
+            if status in (200, 202) or status in REJECTED or status in UNAUTHORIZED:
+                break
+        else:
+            failed.append(name)
+            continue
+
+        if status in UNAUTHORIZED:
+            # keep the queue for when the key is fixed
+            error = "the API refused the api_key (HTTP %d), %d event(s) left queued" % (status, len(names) - index)
+            failed.extend(names[index:])
+            break
+        elif status in (200, 202):
+            sent.append(name)
+        else:
+            # the API rejected the event itself, retrying won't help; set it
+            # aside so it doesn't come back on every flush
+            failed.append(name)
+            try:
+                os.rename(path, path[:-len('.json')] + '.rejected')
+            except OSError:
+                pass
+            continue
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    sender.close()
+    return sent, failed, error
+
+def post_event(module):
+    uri = "https://app.datadoghq.com/api/v1/events?api_key=%s" % module.params['api_key']
 
+    body = build_event(module)
     json_body = module.jsonify(body)
     headers = {"Content-Type": "application/json"}
 
@@ -0,0 +1,330 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+# This file is part of Ansible
+#
+# Ansible is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Ansible is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Ansible.  If not, see <http://www.gnu.org/licenses/>.
+
+DOCUMENTATION = '''
+---
+module: deployment_notify
+version_added: "1.9"
+author: Ansible
+short_description: Notify several deployment trackers about a deploy at once
+description:
+  - Sends the same deployment event to New Relic, Rollbar, Airbrake and/or
+    Stackdriver in parallel, instead of one M(newrelic_deployment),
+    M(rollbar_deployment), M(airbrake_deployment) and M(stackdriver) task
+    after the other.
+  - Only the services given a hash of settings are notified. Settings in
+    that hash override the common options below and take the same names
+    as the options of the dedicated module.
+  - Returns the outcome per service in C(results) and fails if any of
+    them could not be notified.
+  - Python older than 2.7.9 can only validate certificates through
+    Ansible's own HTTP helper, so there, unless I(validate_certs=no), the
+    services are notified one after the other.
+options:
+  revision:
+    description:
+      - Revision number/sha being deployed.
+    required: true
+  environment:
+    description:
+      - Name of the environment being deployed, e.g. 'production'.
+    required: false
+  user:
+    description:
+      - User who deployed.
+    required: false
+    default: Ansible
+  repo:
+    description:
+      - Repository being deployed.
+    required: false
+  comment:
+    description:
+      - Deploy comment (e.g. what is being deployed).
+    required: false
+  timeout:
+    description:
+      - Seconds to wait for each service to answer.
+    required: false
+    default: 10
+  newrelic:
+    description:
+      - New Relic settings, at least C(token) and one of C(app_name) or
+        C(application_id). See M(newrelic_deployment).
+    required: false
+  rollbar:
+    description:
+      - Rollbar settings, at least C(token). See M(rollbar_deployment).
+    required: false
+  airbrake:
+    description:
+      - Airbrake settings, at least C(token). See M(airbrake_deployment).
+    required: false
+  stackdriver:
+    description:
+      - Stackdriver settings, at least C(key). See M(stackdriver).
+    required: false
+  validate_certs:
+    description:
+      - If C(no), SSL certificates will not be validated. This should only be used
+        on personally controlled sites using self-signed certificates.
+    required: false
+    default: 'yes'
+    choices: ['yes', 'no']
+'''
+
+EXAMPLES = '''
+- deployment_notify:
+    revision: "{{ app_version }}"
+    environment: production
+    repo: git@github.com:example/myapp.git
+    comment: "Release {{ app_version }}"
+    newrelic: { token: AAAAAA, app_name: myapp }
+    rollbar: { token: BBBBBB, rollbar_user: admin }
+    airbrake: { token: CCCCCC }
+    stackdriver: { key: DDDDDD }
+'''
+
+import threading
+import urllib
+import urllib2
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+try:
+    import ssl
+except ImportError:
+    ssl = None
+
+# ===========================================
+# Payload builders, one per service. Each returns the url, body and headers
+# of the request the dedicated module sends for the same settings.
+#
+
+def newrelic_request(settings):
+    if settings.get('app_name') and settings.get('application_id'):
+        raise ValueError("only one of 'app_name' or 'application_id' can be set")
+    if not settings.get('token'):
+        raise ValueError("token is required")
+
+    params = {}
+    if settings.get('app_name'):
+        params['app_name'] = settings['app_name']
+    elif settings.get('application_id'):
+        params['application_id'] = settings['application_id']
+    else:
+        raise ValueError("you must set one of 'app_name' or 'application_id'")
+    for item in ['changelog', 'description', 'revision', 'user', 'appname', 'environment']:
+        if settings.get(item):
+            params[item] = settings[item]
+
+    url = settings.get('url') or "https://rpm.newrelic.com/deployments.xml"
+    headers = {'x-api-key': settings['token']}
+    return url, urllib.urlencode(params), headers, (200, 201)
+
+def rollbar_request(settings):
+    for item in ['token', 'environment', 'revision']:
+        if not settings.get(item):
+            raise ValueError("%s is required" % item)
+
+    params = dict(
+        access_token=settings['token'],
+        environment=settings['environment'],
+        revision=settings['revision']
+    )
+    if settings.get('user'):
+        params['local_username'] = settings['user']
+    if settings.get('rollbar_user'):
+        params['rollbar_username'] = settings['rollbar_user']
+    if settings.get('comment'):
+        params['comment'] = settings['comment']
+
+    url = settings.get('url') or 'https://api.rollbar.com/api/1/deploy/'
+    return url, urllib.urlencode(params), {}, (200,)
+
+def airbrake_request(settings):
+    for item in ['token', 'environment']:
+        if not settings.get(item):
+            raise ValueError("%s is required" % item)
+
+    params = {}
+    params["deploy[rails_env]"] = settings['environment']
+    if settings.get('user'):
+        params["deploy[local_username]"] = settings['user']
+    if settings.get('repo'):
+        params["deploy[scm_repository]"] = settings['repo']
+    if settings.get('revision'):
+        params["deploy[scm_revision]"] = settings['revision']
+    params["api_key"] = settings['token']
+
+    url = settings.get('url') or 'https://api.airbrake.io/deploys.txt'
+    return url, urllib.urlencode(params), {}, (200,)
+
+def stackdriver_request(settings):
+    for item in ['key', 'revision_id']:
+        if not settings.get(item):
+            raise ValueError("%s is required" % item)
+
+    params = {}
+    params['revision_id'] = settings['revision_id']
+    params['deployed_by'] = settings.get('deployed_by') or 'Ansible'
+    if settings.get('deployed_to'):
+        params['deployed_to'] = settings['deployed_to']
+    if settings.get('repository'):
+        params['repository'] = settings['repository']
+
+    url = "https://event-gateway.stackdriver.com/v1/deployevent"
+    headers = {
+        'Content-Type': 'application/json',
+        'x-stackdriver-apikey': settings['key']
+    }
+    return url, json.dumps(params), headers, (200,)
+
+# service => (builder, common option => the service's own option name)
+SERVICES = {
+    'newrelic': (newrelic_request, {'revision': 'revision', 'user': 'user',
+                                    'environment': 'environment', 'comment': 'description'}),
+    'rollbar': (rollbar_request, {'revision': 'revision', 'user': 'user',
+                                  'environment': 'environment', 'comment': 'comment'}),
+    'airbrake': (airbrake_request, {'revision': 'revision', 'user': 'user',
+                                    'environment': 'environment', 'repo': 'repo'}),
+    'stackdriver': (stackdriver_request, {'revision': 'revision_id', 'user': 'deployed_by',
+                                          'environment': 'deployed_to', 'repo': 'repository'}),
+}
+
+def service_settings(module, service):
+    """ Merge the common options under the service's own settings. """
+    builder, names = SERVICES[service]
+    settings = {}
+    for common, own in names.items():
+        if module.params[common] is not None:
+            settings[own] = module.params[common]
+    settings.update(module.params[service])
+    return settings
+
+def record(results, service, url, ok, status):
+    if status in ok:
+        results[service] = dict(changed=True, status=status)
+    else:
+        results[service] = dict(failed=True, status=status,
+                                msg="HTTP result code: %s connecting to %s" % (status, url))
+
+def ssl_context(module):
+    """ Context for urllib2 in the notifying threads; False when this python
+    can't validate certificates there (before 2.7.9) but must. """
+    if module.params['validate_certs']:
+        if hasattr(ssl, 'create_default_context'):
+            return ssl.create_default_context()
+        return False
+    if hasattr(ssl, '_create_unverified_context'):
+        return ssl._create_unverified_context()
+    return None
+
+def notify(service, request, timeout, context, results):
+    """ Runs in a thread, so errors are only recorded: fetch_url could call
+    fail_json from here and print a second result. """
+    url, data, headers, ok = request
+    try:
+        if context is not None:
+            response = urllib2.urlopen(urllib2.Request(url, data, headers), timeout=timeout, context=context)
+        else:
+            response = urllib2.urlopen(urllib2.Request(url, data, headers), timeout=timeout)
+        response.read()
+        status = response.getcode()
+    except urllib2.HTTPError, e:
+        status = e.code
+    except Exception, e:
+        results[service] = dict(failed=True, msg=str(e))
+        return
+    record(results, service, url, ok, status)
+
+def notify_serially(module, requests, results):
+    """ Sends the notifications one after the other through fetch_url,
+    which validates certificates on any python. """
+    for service, (url, data, headers, ok) in sorted(requests.items()):
+        response, info = fetch_url(module, url, data=data, headers=headers,
+                                   method='POST', timeout=module.params['timeout'])
+        if info['status'] == -1:
+            results[service] = dict(failed=True, msg=info['msg'])
+        else:
+            record(results, service, url, ok, info['status'])
+
+# ===========================================
+# Module execution.
+#
+
+def main():
+
+    module = AnsibleModule(
+        argument_spec=dict(
+            revision=dict(required=True),
+            environment=dict(required=False),
+            user=dict(required=False, default='Ansible'),
+            repo=dict(required=False),
+            comment=dict(required=False),
+            timeout=dict(required=False, default=10, type='int'),
+            newrelic=dict(required=False, type='dict'),
+            rollbar=dict(required=False, type='dict'),
+            airbrake=dict(required=False, type='dict'),
+            stackdriver=dict(required=False, type='dict'),
+            validate_certs=dict(default='yes', type='bool'),
+        ),
+        required_one_of=[['newrelic', 'rollbar', 'airbrake', 'stackdriver']],
+        supports_check_mode=True
+    )
+
+    # build every request up front so bad settings fail before anything is sent
+    requests = {}
+    for service in sorted(SERVICES):
+        if module.params[service] is None:
+            continue
+        try:
+            requests[service] = SERVICES[service][0](service_settings(module, service))
+        except ValueError, e:
+            module.fail_json(msg="%s: %s" % (service, e))
+
+    # If we're in check mode, just exit pretending like we succeeded
+    if module.check_mode:
+        module.exit_json(changed=True, results=dict((s, dict(changed=True)) for s in requests))
+
+    results = {}
+    context = ssl_context(module)
+    if context is False:
+        notify_serially(module, requests, results)
+    else:
+        threads = [threading.Thread(target=notify, args=(service, request, module.params['timeout'],
+                                                         context, results))
+                   for service, request in requests.items()]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    failed = sorted(s for s in requests if results.get(s, {}).get('failed', True))
+    if failed:
+        module.fail_json(msg="unable to notify %s" % ', '.join(failed), results=results)
+    module.exit_json(changed=True, results=results)
+
+# import module snippets
+from ansible.module_utils.basic import *
+from ansible.module_utils.urls import *
+
+main()
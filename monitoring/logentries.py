@@ -37,6 +37,8 @@ options:
         default: present
 notes:
     - Requires the LogEntries agent which can be installed following the instructions at logentries.com
+    - The followed logs are read once before any change, and only the
+      logs that were changed are read again afterwards to confirm it.
 '''
 EXAMPLES = '''
 - logentries: path=/var/log/nginx/access.log state=present
@@ -53,53 +55,60 @@ def query_log_status(module, le_path, path, state="present"):
 
         return False
 
+def followed_logs(module, le_path, logs):
+    """ Returns which of the given logs the agent reports as followed. """
+
+    return set(log for log in logs if query_log_status(module, le_path, log))
+
 def follow_log(module, le_path, logs):
     """ Follows one or more logs if not already followed. """
 
-    followed_count = 0
+    followed = followed_logs(module, le_path, logs)
+    todo = [log for log in logs if log not in followed]
 
-    for log in logs:
-        if query_log_status(module, le_path, log):
-            continue
-
-        if module.check_mode:
-            module.exit_json(changed=True)
-        rc, out, err = module.run_command([le_path, 'follow', log])
+    if not todo:
+        module.exit_json(changed=False, msg="logs(s) already followed")
 
-        if not query_log_status(module, le_path, log):
-            module.fail_json(msg="failed to follow '%s': %s" % (log, err.strip()))
+    if module.check_mode:
+        module.exit_json(changed=True)
 
-        followed_count += 1
+    errors = {}
+    for log in todo:
+        rc, out, err = module.run_command([le_path, 'follow', log])
+        errors[log] = err.strip()
 
-    if followed_count > 0:
-        module.exit_json(changed=True, msg="followed %d log(s)" % (followed_count,))
+    # trust the agent's view rather than the exit status of le follow
+    followed = followed_logs(module, le_path, todo)
+    for log in todo:
+        if log not in followed:
+            module.fail_json(msg="failed to follow '%s': %s" % (log, errors[log]))
 
-    module.exit_json(changed=False, msg="logs(s) already followed")
+    module.exit_json(changed=True, msg="followed %d log(s)" % (len(todo),))
 
 def unfollow_log(module, le_path, logs):
     """ Unfollows one or more logs if followed. """
 
-    removed_count = 0
-
-    # Using a for loop incase of error, we can report the package that failed
-    for log in logs:
-        # Query the log first, to see if we even need to remove.
-        if not query_log_status(module, le_path, log):
-            continue
+    followed = followed_logs(module, le_path, logs)
+    todo = [log for log in logs if log in followed]
 
-        if module.check_mode:
-            module.exit_json(changed=True)
-        rc, out, err = module.run_command([le_path, 'rm', log])
+    if not todo:
+        module.exit_json(changed=False, msg="logs(s) already unfollowed")
 
-        if query_log_status(module, le_path, log):
-            module.fail_json(msg="failed to remove '%s': %s" % (log, err.strip()))
+    if module.check_mode:
+        module.exit_json(changed=True)
 
-        removed_count += 1
+    errors = {}
+    for log in todo:
+        rc, out, err = module.run_command([le_path, 'rm', log])
+        errors[log] = err.strip()
 
-    if removed_count > 0:
-        module.exit_json(changed=True, msg="removed %d package(s)" % removed_count)
+    # Using one final read, we can still report the log that failed
+    followed = followed_logs(module, le_path, todo)
+    for log in todo:
+        if log in followed:
+            module.fail_json(msg="failed to remove '%s': %s" % (log, errors[log]))
 
-    module.exit_json(changed=False, msg="logs(s) already unfollowed")
+    module.exit_json(changed=True, msg="removed %d package(s)" % len(todo))
 
 def main():
     module = AnsibleModule(
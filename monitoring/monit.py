@@ -29,15 +29,45 @@ version_added: "1.2"
 options:
   name:
     description:
-      - The name of the I(monit) program/process to manage
-    required: true
+      - The name of the I(monit) program/process to manage. Either I(name) or I(names) is required.
+    required: false
+    default: null
+  names:
+    description:
+      - List of I(monit) programs/processes to bring into I(state). They are all handled from a single C(monit summary).
+    required: false
     default: null
+    version_added: "1.9"
   state:
     description:
       - The state of service
     required: true
     default: null
     choices: [ "present", "started", "stopped", "restarted", "monitored", "unmonitored", "reloaded" ]
+  timeout:
+    description:
+      - How many seconds to wait for pending actions (e.g. "start pending") to complete. The summary is polled with an exponential backoff until every program is in the requested state. C(0) returns as soon as monit has accepted the actions.
+    required: false
+    default: 300
+    version_added: "1.9"
+  url:
+    description:
+      - Base URL of the monit HTTP interface (e.g. C(http://localhost:2812)). When given, the module reads the daemon's C(_status?format=xml) report and sends actions through its HTTP API over one keep-alive connection instead of running the monit client.
+    required: false
+    default: null
+    version_added: "1.9"
+  url_username:
+    description:
+      - Username for the monit HTTP interface.
+    required: false
+    default: null
+    version_added: "1.9"
+  url_password:
+    description:
+      - Password for the monit HTTP interface.
+    required: false
+    default: null
+    version_added: "1.9"
 requirements: [ ]
 author: Darryl Stoflet
 '''
@@ -45,109 +75,250 @@ author: Darryl Stoflet
 EXAMPLES = '''
 # Manage the state of program "httpd" to be in "started" state.
 - monit: name=httpd state=started
+
+# Restart several programs and wait up to a minute for them to be running again
+- monit: names=httpd,php-fpm,memcached state=restarted timeout=60
+
+# Same, through the monit HTTP interface
+- monit: names=httpd,php-fpm state=started url=http://localhost:2812 url_username=admin url_password=monit
 '''
 
-def main():
-    arg_spec = dict(
-        name=dict(required=True),
-        state=dict(required=True, choices=['present', 'started', 'restarted', 'stopped', 'monitored', 'unmonitored', 'reloaded'])
-    )
+import os
+import time
+import socket
+import base64
+import httplib
+import urllib
+import urlparse
+import xml.etree.ElementTree as ET
 
-    module = AnsibleModule(argument_spec=arg_spec, supports_check_mode=True)
+# For every state: the monit command to run, whether it is needed given
+# the current status, the final status wanted and the transitional
+# statuses that mean monit is still working on it.
+STATES = {
+    'started': ('start', lambda s: 'running' not in s,
+                lambda s: s == 'running',
+                lambda s: s == 'initializing' or 'start pending' in s),
+    'stopped': ('stop', lambda s: 'running' in s,
+                lambda s: s == 'not monitored',
+                lambda s: 'stop pending' in s),
+    'restarted': ('restart', lambda s: True,
+                  lambda s: s == 'running',
+                  lambda s: s == 'initializing' or 'restart pending' in s),
+    'monitored': ('monitor', lambda s: 'running' not in s,
+                  lambda s: s != 'not monitored' and 'pending' not in s,
+                  lambda s: 'monitor pending' in s),
+    'unmonitored': ('unmonitor', lambda s: 'running' in s,
+                    lambda s: s == 'not monitored',
+                    lambda s: 'unmonitor pending' in s),
+}
 
-    name = module.params['name']
-    state = module.params['state']
 
-    MONIT = module.get_bin_path('monit', True)
+class MonitCLI(object):
+    """Talks to the monit daemon through the monit command line client."""
 
-    if state == 'reloaded':
-        if module.check_mode:
-            module.exit_json(changed=True)
-        rc, out, err = module.run_command('%s reload' % MONIT)
-        if rc != 0:
-            module.fail_json(msg='monit reload failed', stdout=out, stderr=err)
-        module.exit_json(changed=True, name=name, state=state)
-    
-    def status():
-        """Return the status of the process in monit, or the empty string if not present."""
-        rc, out, err = module.run_command('%s summary' % MONIT, check_rc=True)
+    def __init__(self, module):
+        self.module = module
+        self.monit = module.get_bin_path('monit', True)
+
+    def summary(self):
+        """Return {name: status} for every process monit knows about."""
+        rc, out, err = self.module.run_command('%s summary' % self.monit, check_rc=True)
+        services = {}
         for line in out.split('\n'):
             # Sample output lines:
             # Process 'name'    Running
             # Process 'name'    Running - restart pending
             parts = line.lower().split()
-            if len(parts) > 2 and parts[0] == 'process' and parts[1] == "'%s'" % name:
-                return ' '.join(parts[2:])
+            if len(parts) > 2 and parts[0] == 'process':
+                services[parts[1].strip("'")] = ' '.join(parts[2:])
+        return services
+
+    def command(self, command, name):
+        self.module.run_command('%s %s %s' % (self.monit, command, name), check_rc=True)
+
+    def reload(self):
+        rc, out, err = self.module.run_command('%s reload' % self.monit)
+        if rc != 0:
+            self.module.fail_json(msg='monit reload failed', stdout=out, stderr=err)
+
+
+# monit's Action_Type values as reported in <pendingaction>
+PENDING_ACTIONS = {2: 'restart', 3: 'stop', 5: 'unmonitor', 6: 'start', 7: 'monitor'}
+
+
+class MonitHTTP(object):
+    """
+    Talks to the monit daemon through its HTTP interface, keeping one
+    connection open for the status reads and the actions of a run.
+    """
+
+    def __init__(self, module, url, username=None, password=None):
+        self.module = module
+        parts = urlparse.urlparse(url)
+        if parts.scheme == 'https':
+            self.conn = httplib.HTTPSConnection(parts.hostname, parts.port or 443, timeout=30)
         else:
-            return ''
+            self.conn = httplib.HTTPConnection(parts.hostname, parts.port or 2812, timeout=30)
+        self.path = parts.path.rstrip('/')
+        # monit only checks that the posted token matches the cookie
+        self.token = base64.b16encode(os.urandom(16)).lower()
+        self.headers = {'Connection': 'keep-alive',
+                        'Cookie': 'securitytoken=%s' % self.token}
+        if username:
+            auth = base64.b64encode('%s:%s' % (username, password or ''))
+            self.headers['Authorization'] = 'Basic %s' % auth
 
-    def run_command(command):
-        """Runs a monit command, and returns the new status."""
-        module.run_command('%s %s %s' % (MONIT, command, name), check_rc=True)
-        return status()
+    def _request(self, method, path, body=None):
+        headers = dict(self.headers)
+        if body is not None:
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        try:
+            self.conn.request(method, self.path + path, body, headers)
+            response = self.conn.getresponse()
+        except (httplib.HTTPException, socket.error), e:
+            self.module.fail_json(msg='monit HTTP request to %s failed: %s' % (path, e))
+        if response.status != 200:
+            self.module.fail_json(msg='monit HTTP request to %s returned %s %s'
+                                      % (path, response.status, response.reason),
+                                  body=response.read())
+        return response
 
-    present = status() != ''
+    def summary(self):
+        """Return {name: status} for every process monit knows about,
+        with the status worded like 'monit summary' does."""
+        response = self._request('GET', '/_status?format=xml')
+        services = {}
+        try:
+            for event, elem in ET.iterparse(response):
+                if elem.tag != 'service':
+                    continue
+                # type 3 is a process, the only kind 'monit summary' scans
+                kind = elem.get('type') or elem.findtext('type')
+                if kind == '3':
+                    services[elem.findtext('name').lower()] = self._status(elem)
+                elem.clear()
+        except SyntaxError, e:
+            self.module.fail_json(msg='unable to parse monit status: %s' % e)
+        return services
 
-    if not present and not state == 'present':
-        module.fail_json(msg='%s process not presently configured with monit' % name, name=name, state=state)
+    def _status(self, elem):
+        monitor = int(elem.findtext('monitor') or 0)
+        if monitor == 0:
+            status = 'not monitored'
+        elif monitor == 2:
+            status = 'initializing'
+        elif int(elem.findtext('status') or 0) == 0:
+            status = 'running'
+        else:
+            status = 'failed'
+        pending = PENDING_ACTIONS.get(int(elem.findtext('pendingaction') or 0))
+        if pending:
+            status += ' - %s pending' % pending
+        return status
 
-    if state == 'present':
-        if not present:
-            if module.check_mode:
-                module.exit_json(changed=True)
-            status = run_command('reload')
-            if status == '':
-                module.fail_json(msg='%s process not configured with monit' % name, name=name, state=state)
-            else:
-                module.exit_json(changed=True, name=name, state=state)
-        module.exit_json(changed=False, name=name, state=state)
+    def command(self, command, name):
+        body = urllib.urlencode({'service': name, 'action': command,
+                                 'securitytoken': self.token})
+        self._request('POST', '/_doaction', body).read()
 
-    running = 'running' in status()
+    def reload(self):
+        # the HTTP interface has no reload action
+        MonitCLI(self.module).reload()
 
-    if running and state in ['started', 'monitored']:
-        module.exit_json(changed=False, name=name, state=state)
 
-    if running and state == 'stopped':
-        if module.check_mode:
-            module.exit_json(changed=True)
-        status = run_command('stop')
-        if status in ['not monitored'] or 'stop pending' in status:
-            module.exit_json(changed=True, name=name, state=state)
-        module.fail_json(msg='%s process not stopped' % name, status=status)
+def wait_for(monit, names, done, pending, timeout):
+    """
+    Poll the summary with an exponential backoff while any of names is
+    in a pending status. Returns the last summary taken.
+    """
+    deadline = time.time() + timeout
+    delay = 0.5
+    while True:
+        summary = monit.summary()
+        waiting = [n for n in names if not done(summary.get(n.lower(), ''))
+                   and pending(summary.get(n.lower(), ''))]
+        if not waiting or time.time() >= deadline:
+            return summary
+        time.sleep(min(delay, max(0, deadline - time.time())))
+        delay = min(delay * 2, 10)
 
-    if running and state == 'unmonitored':
-        if module.check_mode:
-            module.exit_json(changed=True)
-        status = run_command('unmonitor')
-        if status in ['not monitored']:
-            module.exit_json(changed=True, name=name, state=state)
-        module.fail_json(msg='%s process not unmonitored' % name, status=status)
 
-    elif state == 'restarted':
-        if module.check_mode:
-            module.exit_json(changed=True)
-        status = run_command('restart')
-        if status in ['initializing', 'running'] or 'restart pending' in status:
-            module.exit_json(changed=True, name=name, state=state)
-        module.fail_json(msg='%s process not restarted' % name, status=status)
+def main():
+    arg_spec = dict(
+        name=dict(required=False),
+        names=dict(required=False, type='list'),
+        state=dict(required=True, choices=['present', 'started', 'restarted', 'stopped', 'monitored', 'unmonitored', 'reloaded']),
+        timeout=dict(required=False, default=300, type='int'),
+        url=dict(required=False),
+        url_username=dict(required=False),
+        url_password=dict(required=False, no_log=True),
+    )
 
-    elif not running and state == 'started':
+    module = AnsibleModule(
+        argument_spec=arg_spec,
+        required_one_of=[['name', 'names']],
+        mutually_exclusive=[['name', 'names']],
+        supports_check_mode=True,
+    )
+
+    names = module.params['names'] or [module.params['name']]
+    name = module.params['name'] or names
+    state = module.params['state']
+    timeout = module.params['timeout']
+
+    if module.params['url']:
+        monit = MonitHTTP(module, module.params['url'],
+                          module.params['url_username'], module.params['url_password'])
+    else:
+        monit = MonitCLI(module)
+
+    if state == 'reloaded':
         if module.check_mode:
             module.exit_json(changed=True)
-        status = run_command('start')
-        if status in ['initializing', 'running'] or 'start pending' in status:
-            module.exit_json(changed=True, name=name, state=state)
-        module.fail_json(msg='%s process not started' % name, status=status)
+        monit.reload()
+        module.exit_json(changed=True, name=name, state=state)
+
+    summary = monit.summary()
+    missing = [n for n in names if n.lower() not in summary]
 
-    elif not running and state == 'monitored':
+    if state == 'present':
+        if not missing:
+            module.exit_json(changed=False, name=name, state=state)
         if module.check_mode:
             module.exit_json(changed=True)
-        status = run_command('monitor')
-        if status not in ['not monitored']:
-            module.exit_json(changed=True, name=name, state=state)
-        module.fail_json(msg='%s process not monitored' % name, status=status)
+        monit.reload()
+        summary = monit.summary()
+        missing = [n for n in names if n.lower() not in summary]
+        if missing:
+            module.fail_json(msg='%s process not configured with monit' % ', '.join(missing), name=name, state=state)
+        module.exit_json(changed=True, name=name, state=state)
+
+    if missing:
+        module.fail_json(msg='%s process not presently configured with monit' % ', '.join(missing), name=name, state=state)
+
+    command, needed, done, pending = STATES[state]
+    todo = [n for n in names if needed(summary[n.lower()])]
+    if not todo:
+        module.exit_json(changed=False, name=name, state=state)
+    if module.check_mode:
+        module.exit_json(changed=True, name=name, state=state, services=todo)
+
+    for n in todo:
+        monit.command(command, n)
+
+    if timeout > 0:
+        summary = wait_for(monit, todo, done, pending, timeout)
+        failed = [n for n in todo if not done(summary.get(n.lower(), ''))]
+    else:
+        summary = monit.summary()
+        failed = [n for n in todo if not done(summary.get(n.lower(), ''))
+                  and not pending(summary.get(n.lower(), ''))]
 
-    module.exit_json(changed=False, name=name, state=state)
+    status = dict((n, summary.get(n.lower(), '')) for n in todo)
+    if failed:
+        module.fail_json(msg='%s process not %s' % (', '.join(failed), state), status=status)
+    module.exit_json(changed=True, name=name, state=state, status=status)
 
 # import module snippets
 from ansible.module_utils.basic import *
@@ -36,7 +36,9 @@ options:
                "silence_nagios", "unsilence_nagios", "command" ]
   host:
     description:
-      - Host to operate on in Nagios.
+      - Host to operate on in Nagios. Several hosts can be given as a list
+        or separated by commas; the commands for all of them are written
+        to the command file in one batch.
     required: false
     default: null
   cmdfile:
@@ -65,6 +67,30 @@ options:
     aliases: [ "service" ]
     required: true
     default: null
+  status_file:
+    description:
+      - Path to the Nagios I(status file) (status.dat). Before writing,
+        the module scans it for the current notification settings and
+        downtimes of the hosts involved and only sends the commands that
+        would change something, so re-running a play does not stack up
+        duplicate downtime. A downtime is only left out when one with the
+        same author and duration already lasts until the requested end;
+        a request that extends the window is sent. If the file can't be
+        read every command is sent, as before.
+    required: false
+    default: auto-detected
+    version_added: "1.9"
+  livestatus_socket:
+    description:
+      - Path to the UNIX socket of MK Livestatus. When given, the current
+        state is read with one batch of Livestatus queries and the
+        commands are sent over the same connection instead of the
+        command file. The module then queries the state again to
+        confirm the commands took effect and lists those that did not
+        in C(unverified_commands).
+    required: false
+    default: null
+    version_added: "1.9"
   command:
     description:
       - The raw command to send to nagios, which
@@ -87,9 +113,16 @@ EXAMPLES = '''
 # schedule downtime for ALL services on HOST
 - nagios: action=downtime minutes=45 service=all host={{ inventory_hostname }}
 
+# schedule an hour of downtime for all services on a whole rack at once
+- nagios: action=downtime minutes=60 service=all host={{ groups['rack12'] | join(',') }}
+  run_once: true
+
 # schedule downtime for a few services
 - nagios: action=downtime services=frob,foobar,qeuz host={{ inventory_hostname }}
 
+# same, sent through MK Livestatus
+- nagios: action=downtime services=frob,foobar,qeuz host={{ inventory_hostname }} livestatus_socket=/var/lib/nagios3/rw/live
+
 # enable SMART disk alerts
 - nagios: action=enable_alerts service=smart host={{ inventory_hostname }}
 
@@ -118,12 +151,25 @@ EXAMPLES = '''
 import ConfigParser
 import types
 import time
+import os
 import os.path
+import select
+import socket
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+# Writes of at most PIPE_BUF bytes to a FIFO are atomic (POSIX
+# guarantees at least 512), so batched commands never interleave with
+# those of other writers.
+PIPE_BUF = getattr(select, 'PIPE_BUF', 512)
 
 ######################################################################
 
 
-def which_cmdfile():
+def nagios_cfg_value(key):
     locations = [
         # rhel
         '/etc/nagios/nagios.cfg',
@@ -151,13 +197,277 @@ def which_cmdfile():
     for path in locations:
         if os.path.exists(path):
             for line in open(path):
-                if line.startswith('command_file'):
+                if line.startswith(key + '='):
                     return line.split('=')[1].strip()
 
     return None
 
+
+def which_cmdfile():
+    return nagios_cfg_value('command_file')
+
+
+def which_status_file():
+    return nagios_cfg_value('status_file')
+
+######################################################################
+
+# status.dat blocks that decide whether a command changes anything
+STATUS_BLOCKS = ['programstatus', 'hoststatus', 'servicestatus',
+                 'hostdowntime', 'servicedowntime']
+
+
+# external commands NagiosStatus.is_noop() knows how to evaluate
+CHECKED_COMMANDS = [
+    'ENABLE_NOTIFICATIONS', 'DISABLE_NOTIFICATIONS',
+    'ENABLE_HOST_NOTIFICATIONS', 'DISABLE_HOST_NOTIFICATIONS',
+    'ENABLE_SVC_NOTIFICATIONS', 'DISABLE_SVC_NOTIFICATIONS',
+    'ENABLE_HOST_SVC_NOTIFICATIONS', 'DISABLE_HOST_SVC_NOTIFICATIONS',
+    'SCHEDULE_HOST_DOWNTIME', 'SCHEDULE_SVC_DOWNTIME',
+    'SCHEDULE_HOST_SVC_DOWNTIME',
+    ]
+
+
+def parse_status_file(path, wanted=None):
+    """
+    Stream the blocks of a Nagios status.dat (or retention.dat) file.
+
+    Yields (block_type, attributes) one block at a time, so memory use
+    does not grow with the size of the file. The lines of blocks whose
+    type is not in wanted are skipped without being split.
+    """
+
+    fp = open(path)
+    try:
+        block = None
+        attrs = None
+        for line in fp:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            if block is None:
+                if line.endswith('{'):
+                    block = line[:-1].strip()
+                    attrs = {}
+                continue
+            if line == '}':
+                if wanted is None or block in wanted:
+                    yield block, attrs
+                block = None
+            elif wanted is None or block in wanted:
+                key, _, value = line.partition('=')
+                attrs[key] = value
+    finally:
+        fp.close()
+
+
+class Livestatus(object):
+    """
+    Minimal MK Livestatus client keeping one UNIX socket connection
+    open for all queries and commands of a run.
+    """
+
+    def __init__(self, path, timeout=10):
+        self.path = path
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        self.sock.connect(path)
+
+    def close(self):
+        self.sock.close()
+
+    def _recv(self, size):
+        data = ''
+        while len(data) < size:
+            chunk = self.sock.recv(size - len(data))
+            if not chunk:
+                raise IOError('livestatus closed the connection')
+            data += chunk
+        return data
+
+    def _request(self, table, columns, filters):
+        lines = ['GET %s' % table, 'Columns: %s' % ' '.join(columns)]
+        lines += ['Filter: %s' % f for f in filters]
+        if len(filters) > 1:
+            lines.append('Or: %d' % len(filters))
+        lines += ['OutputFormat: json', 'KeepAlive: on',
+                  'ResponseHeader: fixed16']
+        return '\n'.join(lines) + '\n\n'
+
+    def query_many(self, queries):
+        """
+        Send several (table, columns, filters) queries in one go and
+        return the rows of each as lists of dicts. Filters are ORed.
+        """
+
+        self.sock.sendall(''.join(self._request(*q) for q in queries))
+        results = []
+        for table, columns, filters in queries:
+            # fixed16 header: 3 digit status, space, 11 digit length, newline
+            header = self._recv(16)
+            code, length = int(header[:3]), int(header[4:15])
+            body = self._recv(length)
+            if code != 200:
+                raise IOError('livestatus query on %s failed: %s' % (table, body.strip()))
+            results.append([dict(zip(columns, row)) for row in json.loads(body)])
+        return results
+
+    def command(self, cmds):
+        """
+        Send external commands; Livestatus does not answer these.
+        """
+
+        data = ''.join('COMMAND %s\n\n' % cmd.strip() for cmd in cmds)
+        self.sock.sendall(data)
+        return len(data)
+
+
+class NagiosStatus(object):
+    """
+    Notification settings and pending downtimes of a set of hosts, as
+    recorded in status.dat or reported by Livestatus, used to leave out
+    commands that would not change anything.
+    """
+
+    def __init__(self, hosts):
+        self.hosts = set(hosts)
+        self.notifications = None
+        self.host_notifications = {}   # host => enabled
+        self.svc_notifications = {}    # (host, service) => enabled
+        self.services = {}             # host => [service, ...]
+        self.downtimes = {}            # (host, service, author, duration) => latest end_time
+
+    def load_status_file(self, path):
+        """
+        Index the state of our hosts from status.dat.
+        """
+
+        now = time.time()
+        for block, attrs in parse_status_file(path, STATUS_BLOCKS):
+            if block == 'programstatus':
+                self.notifications = attrs.get('enable_notifications') == '1'
+                continue
+
+            host = attrs.get('host_name')
+            if host not in self.hosts:
+                continue
+            svc = attrs.get('service_description')
+            if block == 'hoststatus':
+                self.host_notifications[host] = attrs.get('notifications_enabled') == '1'
+            elif block == 'servicestatus':
+                self.svc_notifications[(host, svc)] = attrs.get('notifications_enabled') == '1'
+                self.services.setdefault(host, []).append(svc)
+            elif int(attrs.get('end_time', 0)) > now:
+                self._add_downtime((host, svc, attrs.get('author'),
+                                    attrs.get('duration')), int(attrs['end_time']))
+
+    def load_livestatus(self, livestatus):
+        """
+        Index the state of our hosts with one batch of Livestatus
+        queries.
+        """
+
+        hosts = sorted(self.hosts)
+        queries = [('status', ['enable_notifications'], [])]
+        if hosts:
+            queries += [
+                ('hosts', ['name', 'notifications_enabled'],
+                 ['name = %s' % h for h in hosts]),
+                ('services', ['host_name', 'description', 'notifications_enabled'],
+                 ['host_name = %s' % h for h in hosts]),
+                ('downtimes', ['host_name', 'service_description', 'author',
+                               'duration', 'end_time'],
+                 ['host_name = %s' % h for h in hosts]),
+                ]
+        results = livestatus.query_many(queries)
+        status = results[0]
+        host_rows, svc_rows, dt_rows = (results[1:] + [[], [], []])[:3]
+
+        if status:
+            self.notifications = status[0]['enable_notifications'] == 1
+        for row in host_rows:
+            self.host_notifications[row['name']] = row['notifications_enabled'] == 1
+        for row in svc_rows:
+            key = (row['host_name'], row['description'])
+            self.svc_notifications[key] = row['notifications_enabled'] == 1
+            self.services.setdefault(row['host_name'], []).append(row['description'])
+        now = time.time()
+        for row in dt_rows:
+            if row['end_time'] > now:
+                self._add_downtime((row['host_name'],
+                                    row['service_description'] or None,
+                                    row['author'], str(row['duration'])),
+                                   int(row['end_time']))
+
+    def _add_downtime(self, key, end_time):
+        self.downtimes[key] = max(end_time, self.downtimes.get(key, 0))
+
+    def _has_downtime(self, key, end_time):
+        """
+        True if a downtime like key already lasts until end_time, so a
+        request extending the window is not mistaken for a duplicate.
+        """
+
+        try:
+            end_time = int(end_time)
+        except ValueError:
+            return False
+        return self.downtimes.get(key, 0) >= end_time
+
+    def _all_services(self, host, test):
+        services = self.services.get(host)
+        return bool(services) and all(test(svc) for svc in services)
+
+    def covers(self, cmd):
+        """
+        True if the effect of the command can be checked by is_noop().
+        """
+
+        name = cmd.strip().split('] ', 1)[-1].split(';')[0].strip()
+        return name in CHECKED_COMMANDS
+
+    def is_noop(self, cmd):
+        """
+        True if the formatted external command would not change the
+        state of Nagios.
+        """
+
+        fields = cmd.strip().split('] ', 1)[-1].split(';')
+        name, args = fields[0].strip(), fields[1:]
+
+        if name in ('ENABLE_NOTIFICATIONS', 'DISABLE_NOTIFICATIONS'):
+            return self.notifications == name.startswith('ENABLE')
+        if not args:
+            return False
+
+        host = args[0]
+        enable = name.startswith('ENABLE')
+        if name in ('ENABLE_HOST_NOTIFICATIONS', 'DISABLE_HOST_NOTIFICATIONS'):
+            return self.host_notifications.get(host) == enable
+        if name in ('ENABLE_SVC_NOTIFICATIONS', 'DISABLE_SVC_NOTIFICATIONS'):
+            return len(args) > 1 and \
+                self.svc_notifications.get((host, args[1])) == enable
+        if name in ('ENABLE_HOST_SVC_NOTIFICATIONS', 'DISABLE_HOST_SVC_NOTIFICATIONS'):
+            return self._all_services(
+                host, lambda svc: self.svc_notifications[(host, svc)] == enable)
+
+        # downtime: <start>;<end>;<fixed>;<trigger>;<duration>;<author>;...
+        if name == 'SCHEDULE_HOST_DOWNTIME' and len(args) >= 7:
+            return self._has_downtime((host, None, args[6], args[5]), args[2])
+        if name == 'SCHEDULE_SVC_DOWNTIME' and len(args) >= 8:
+            return self._has_downtime((host, args[1], args[7], args[6]), args[3])
+        if name == 'SCHEDULE_HOST_SVC_DOWNTIME' and len(args) >= 7:
+            return self._all_services(
+                host, lambda svc: self._has_downtime((host, svc, args[6], args[5]), args[2]))
+
+        return False
+
 ######################################################################
 
+# actions that are applied to every host given
+HOST_ACTIONS = ['downtime', 'silence', 'unsilence', 'enable_alerts',
+                'disable_alerts']
+
 
 def main():
     ACTION_CHOICES = [
@@ -175,9 +485,11 @@ def main():
         argument_spec=dict(
             action=dict(required=True, default=None, choices=ACTION_CHOICES),
             author=dict(default='Ansible'),
-            host=dict(required=False, default=None),
+            host=dict(required=False, default=None, type='list'),
             minutes=dict(default=30),
-            cmdfile=dict(default=which_cmdfile()),
+            cmdfile=dict(default=None),
+            status_file=dict(default=None),
+            livestatus_socket=dict(default=None),
             services=dict(default=None, aliases=['service']),
             command=dict(required=False, default=None),
             )
@@ -188,6 +500,8 @@ def main():
     minutes = module.params['minutes']
     services = module.params['services']
     cmdfile = module.params['cmdfile']
+    if not cmdfile:
+        cmdfile = module.params['cmdfile'] = which_cmdfile()
     command = module.params['command']
     
     ##################################################################
@@ -226,8 +540,8 @@ def main():
         if not command:
             module.fail_json(msg='no command passed for command action')
     ##################################################################
-    if not cmdfile:
-        module.fail_json('unable to locate nagios.cfg')
+    if not cmdfile and not module.params['livestatus_socket']:
+        module.fail_json(msg='unable to locate nagios.cfg')
 
     ##################################################################
     ansible_nagios = Nagios(module, **module.params)
@@ -258,10 +572,30 @@ class Nagios(object):
         self.module = module
         self.action = kwargs['action']
         self.author = kwargs['author']
-        self.host = kwargs['host']
+        self.hosts = kwargs['host'] or []
         self.minutes = int(kwargs['minutes'])
         self.cmdfile = kwargs['cmdfile']
         self.command = kwargs['command']
+        self.status = None
+        self.livestatus = None
+
+        if kwargs.get('livestatus_socket'):
+            try:
+                self.livestatus = Livestatus(kwargs['livestatus_socket'])
+                if self.action != 'command':
+                    self.status = NagiosStatus(self.hosts)
+                    self.status.load_livestatus(self.livestatus)
+            except (IOError, socket.error, ValueError), e:
+                self.module.fail_json(msg='unable to query livestatus: %s' % e,
+                                      livestatus_socket=kwargs['livestatus_socket'])
+        else:
+            status_file = kwargs.get('status_file') or which_status_file()
+            if self.action != 'command' and status_file and os.path.isfile(status_file):
+                try:
+                    self.status = NagiosStatus(self.hosts)
+                    self.status.load_status_file(status_file)
+                except (IOError, ValueError):
+                    self.status = None
 
         if (kwargs['services'] is None) or (kwargs['services'] == 'host') or (kwargs['services'] == 'all'):
             self.services = kwargs['services']
@@ -269,6 +603,10 @@ class Nagios(object):
             self.services = kwargs['services'].split(',')
 
         self.command_results = []
+        self.unverified_commands = []
+        self.skipped_commands = []
+        self.command_buffer = []
+        self.bytes_written = 0
 
     def _now(self):
         """
@@ -279,19 +617,87 @@ class Nagios(object):
 
     def _write_command(self, cmd):
         """
-        Write the given command to the Nagios command file
+        Queue the given command for the Nagios command file. Queued
+        commands are written out by _flush_commands().
+        """
+
+        if isinstance(cmd, unicode):
+            cmd = cmd.encode('utf-8')
+        if self.status is not None and self.status.is_noop(cmd):
+            self.skipped_commands.append(cmd.strip())
+            return
+        self.command_buffer.append(cmd)
+
+    def _flush_commands(self):
+        """
+        Write all queued commands to the Nagios command file.
+
+        The file is opened once and the commands are packed into as
+        few write() calls as possible, none larger than PIPE_BUF
+        unless a single command is, so every write is atomic.
         """
 
+        if not self.command_buffer:
+            return
+
+        if self.livestatus is not None:
+            return self._send_livestatus()
+
+        chunks = []
+        chunk = ''
+        for cmd in self.command_buffer:
+            if chunk and len(chunk) + len(cmd) > PIPE_BUF:
+                chunks.append(chunk)
+                chunk = ''
+            chunk += cmd
+        chunks.append(chunk)
+
         try:
-            fp = open(self.cmdfile, 'w')
-            fp.write(cmd)
-            fp.flush()
-            fp.close()
-            self.command_results.append(cmd.strip())
-        except IOError:
+            fd = os.open(self.cmdfile, os.O_WRONLY | os.O_APPEND)
+            try:
+                for chunk in chunks:
+                    while chunk:
+                        written = os.write(fd, chunk)
+                        self.bytes_written += written
+                        chunk = chunk[written:]
+            finally:
+                os.close(fd)
+        except (IOError, OSError):
             self.module.fail_json(msg='unable to write to nagios command file',
                                   cmdfile=self.cmdfile)
 
+        self.command_results.extend(cmd.strip() for cmd in self.command_buffer)
+        self.command_buffer = []
+
+    def _send_livestatus(self):
+        """
+        Send all queued commands over the Livestatus connection, then
+        check that Nagios applied them by querying its state again.
+        """
+
+        try:
+            self.bytes_written += self.livestatus.command(self.command_buffer)
+        except (IOError, socket.error), e:
+            self.module.fail_json(msg='unable to send commands to livestatus: %s' % e)
+        self.command_results.extend(cmd.strip() for cmd in self.command_buffer)
+
+        # commands are processed asynchronously; give Nagios a moment
+        pending = [cmd for cmd in self.command_buffer
+                   if self.status is not None and self.status.covers(cmd)]
+        for delay in (0.1, 0.2, 0.4, 0.8, 1.5):
+            if not pending:
+                break
+            time.sleep(delay)
+            status = NagiosStatus(self.hosts)
+            try:
+                status.load_livestatus(self.livestatus)
+            except (IOError, socket.error, ValueError):
+                break
+            pending = [cmd for cmd in pending if not status.is_noop(cmd)]
+
+        self.unverified_commands = [cmd.strip() for cmd in pending]
+        self.command_buffer = []
+
     def _fmt_dt_str(self, cmd, host, duration, author=None,
                     comment="Scheduling downtime", start=None,
                     svc=None, fixed=1, trigger=0):
@@ -825,54 +1231,67 @@ class Nagios(object):
         Figure out what you want to do from ansible, and then do the
         needful (at the earliest).
         """
+        for host in self.hosts:
+            self.act_on_host(host)
+
+        if self.action == 'silence_nagios':
+            self.silence_nagios()
+            
+        elif self.action == 'unsilence_nagios':
+            self.unsilence_nagios()
+            
+        elif self.action == 'command':
+            self.nagios_cmd(self.command)
+            
+        # wtf?
+        elif self.action not in HOST_ACTIONS:
+            self.module.fail_json(msg="unknown action specified: '%s'" % \
+                                      self.action)
+
+        self._flush_commands()
+        self.module.exit_json(nagios_commands=self.command_results,
+                              skipped_commands=self.skipped_commands,
+                              unverified_commands=self.unverified_commands,
+                              commands_written=len(self.command_results),
+                              bytes_written=self.bytes_written,
+                              changed=bool(self.command_results))
+
+    def act_on_host(self, host):
+        """
+        Queue the commands of a per-host action for one host.
+        """
         # host or service downtime?
         if self.action == 'downtime':
             if self.services == 'host':
-                self.schedule_host_downtime(self.host, self.minutes)
+                self.schedule_host_downtime(host, self.minutes)
             elif self.services == 'all':
-                self.schedule_host_svc_downtime(self.host, self.minutes)
+                self.schedule_host_svc_downtime(host, self.minutes)
             else:
-                self.schedule_svc_downtime(self.host,
+                self.schedule_svc_downtime(host,
                                            services=self.services,
                                            minutes=self.minutes)
 
         # toggle the host AND service alerts
         elif self.action == 'silence':
-            self.silence_host(self.host)
+            self.silence_host(host)
 
         elif self.action == 'unsilence':
-            self.unsilence_host(self.host)
+            self.unsilence_host(host)
 
         # toggle host/svc alerts
         elif self.action == 'enable_alerts':
             if self.services == 'host':
-                self.enable_host_notifications(self.host)
+                self.enable_host_notifications(host)
             else:
-                self.enable_svc_notifications(self.host,
+                self.enable_svc_notifications(host,
                                               services=self.services)
 
         elif self.action == 'disable_alerts':
             if self.services == 'host':
-                self.disable_host_notifications(self.host)
+                self.disable_host_notifications(host)
             else:
-                self.disable_svc_notifications(self.host,
+                self.disable_svc_notifications(host,
                                                services=self.services)
-        elif self.action == 'silence_nagios':
-            self.silence_nagios()
-            
-        elif self.action == 'unsilence_nagios':
-            self.unsilence_nagios()
-            
-        elif self.action == 'command':
-            self.nagios_cmd(self.command)
-            
-        # wtf?
-        else:
-            self.module.fail_json(msg="unknown action specified: '%s'" % \
-                                      self.action)
-
-        self.module.exit_json(nagios_commands=self.command_results,
-                              changed=True)
 
 ######################################################################
 # import module snippets
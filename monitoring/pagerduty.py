@@ -58,7 +58,10 @@ options:
         version_added: '1.8'
     service:
         description:
-            - PagerDuty service ID.
+            - PagerDuty service ID. Several services can be given as a list
+              or separated by commas; they share one maintenance window.
+              With state=ongoing, only windows covering these services are
+              listed.
         required: false
         default: null
         choices: []
@@ -96,6 +99,11 @@ options:
 
 notes:
     - This module does not yet have support to end maintenance windows.
+    - Maintenance windows are listed with server-side service filtering,
+      following every page of results.
+    - When creating a window, services already covered by an ongoing
+      window that lasts at least as long as the requested one are left
+      out, and no window is created if all of them are covered.
 '''
 
 EXAMPLES='''
@@ -121,6 +129,14 @@ EXAMPLES='''
              service=FOO123
 
 
+# Create one 2 hour maintenance window for services FOO123 and BAR456
+- pagerduty: name=companyabc
+             token=xxxxxxxxxxxxxx
+             requester_id=ABC1234
+             state=running
+             service=FOO123,BAR456
+             hours=2
+
 # Create a 4 hour maintenance window for service FOO123 with the description "deployment".
 - pagerduty: name=companyabc
              user=example@example.com
@@ -134,6 +150,7 @@ EXAMPLES='''
 import json
 import datetime
 import base64
+import urllib
 
 def auth_header(user, passwd, token):
     if token:
@@ -142,29 +159,72 @@ def auth_header(user, passwd, token):
     auth = base64.encodestring('%s:%s' % (user, passwd)).replace('\n', '')
     return "Basic %s" % auth
 
-def ongoing(module, name, user, passwd, token):
-    url = "https://" + name + ".pagerduty.com/api/v1/maintenance_windows/ongoing"
+def parse_time(value):
+    """ Parse a PagerDuty ISO 8601 timestamp into a naive UTC datetime. """
+    value = value.strip()
+    offset = datetime.timedelta()
+    if value.endswith('Z'):
+        value = value[:-1]
+    elif len(value) > 19 and value[-6] in '+-':
+        sign = value[-6] == '-' and -1 or 1
+        offset = sign * datetime.timedelta(hours=int(value[-5:-3]), minutes=int(value[-2:]))
+        value = value[:-6]
+    return datetime.datetime.strptime(value[:19], "%Y-%m-%dT%H:%M:%S") - offset
+
+
+def windows(module, name, user, passwd, token, service_ids=None, filter='ongoing', limit=100):
+    """ Yield maintenance windows matching filter, page by page. """
+    url = "https://" + name + ".pagerduty.com/api/v1/maintenance_windows"
     headers = {"Authorization": auth_header(user, passwd, token)}
+    params = {'filter': filter, 'limit': limit}
+    if service_ids:
+        params['service_ids'] = ','.join(service_ids)
 
-    response, info = fetch_url(module, url, headers=headers)
-    if info['status'] != 200:
-        module.fail_json(msg="failed to lookup the ongoing window: %s" % info['msg'])
+    offset = 0
+    while True:
+        params['offset'] = offset
+        response, info = fetch_url(module, url + '?' + urllib.urlencode(params), headers=headers)
+        if info['status'] != 200:
+            module.fail_json(msg="failed to lookup the maintenance windows: %s" % info['msg'])
+        page = json.load(response)
+        found = page.get('maintenance_windows', [])
+        for window in found:
+            yield window
+        offset += len(found)
+        if not found or offset >= int(page.get('total') or 0):
+            break
 
-    return False, response.read()
 
+def ongoing(module, name, user, passwd, token, service_ids=None):
+    found = list(windows(module, name, user, passwd, token, service_ids))
+    return False, {'maintenance_windows': found, 'total': len(found)}
 
-def create(module, name, user, passwd, token, requester_id, service, hours, minutes, desc):
+
+def create(module, name, user, passwd, token, requester_id, service_ids, hours, minutes, desc):
     now = datetime.datetime.utcnow()
     later = now + datetime.timedelta(hours=int(hours), minutes=int(minutes))
     start = now.strftime("%Y-%m-%dT%H:%M:%SZ")
     end = later.strftime("%Y-%m-%dT%H:%M:%SZ")
 
+    # services already in an ongoing window lasting long enough are done
+    covering = []
+    covered = set()
+    for window in windows(module, name, user, passwd, token, service_ids):
+        if parse_time(window['end_time']) >= later:
+            ids = set(svc['id'] for svc in window.get('services', []))
+            if ids & set(service_ids):
+                covering.append(window)
+                covered |= ids
+    needed = [svc for svc in service_ids if svc not in covered]
+    if not needed:
+        return False, False, {'maintenance_windows': covering}
+
     url = "https://" + name + ".pagerduty.com/api/v1/maintenance_windows"
     headers = {
         'Authorization': auth_header(user, passwd, token),
         'Content-Type' : 'application/json',
     }
-    request_data = {'maintenance_window': {'start_time': start, 'end_time': end, 'description': desc, 'service_ids': [service]}}
+    request_data = {'maintenance_window': {'start_time': start, 'end_time': end, 'description': desc, 'service_ids': needed}}
     if requester_id:
         request_data['requester_id'] = requester_id
     else:
@@ -173,10 +233,11 @@ def create(module, name, user, passwd, token, requester_id, service, hours, minu
 
     data = json.dumps(request_data)
     response, info = fetch_url(module, url, data=data, headers=headers, method='POST')
-    if info['status'] != 200:
+    if info['status'] not in (200, 201):
         module.fail_json(msg="failed to create the window: %s" % info['msg'])
 
-    return False, response.read()
+    created = json.load(response).get('maintenance_window')
+    return False, True, {'maintenance_windows': covering + [created]}
 
 
 def main():
@@ -188,7 +249,7 @@ def main():
         user=dict(required=False),
         passwd=dict(required=False),
         token=dict(required=False),
-        service=dict(required=False),
+        service=dict(required=False, type='list'),
         requester_id=dict(required=False),
         hours=dict(default='1', required=False),
         minutes=dict(default='0', required=False),
@@ -212,18 +273,19 @@ def main():
     if not token and not (user or passwd):
         module.fail_json(msg="neither user and passwd nor token specified")
 
+    changed = False
     if state == "running" or state == "started":
         if not service:
             module.fail_json(msg="service not specified")
-        (rc, out) = create(module, name, user, passwd, token, requester_id, service, hours, minutes, desc)
+        (rc, changed, out) = create(module, name, user, passwd, token, requester_id, service, hours, minutes, desc)
 
     if state == "ongoing":
-        (rc, out) = ongoing(module, name, user, passwd, token)
+        (rc, out) = ongoing(module, name, user, passwd, token, service)
 
     if rc != 0:
         module.fail_json(msg="failed", result=out)
 
-    module.exit_json(msg="success", result=out)
+    module.exit_json(msg="success", changed=changed, result=out)
 
 # import module snippets
 from ansible.module_utils.basic import *
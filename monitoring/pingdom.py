@@ -20,11 +20,21 @@ options:
         aliases: []
     checkid:
         description:
-            - Pingdom ID of the check.
-        required: true
+            - Pingdom ID of the check. Several checks can be given as a list
+              or separated by commas; they are all paused or unpaused with a
+              single API request. Either I(checkid) or I(tags) is required.
+        required: false
+        default: null
+        choices: []
+        aliases: []
+    tags:
+        description:
+            - Act on every check carrying one of these tags.
+        required: false
         default: null
         choices: []
         aliases: []
+        version_added: "1.9"
     uid:
         description:
             - Pingdom user ID.
@@ -48,6 +58,8 @@ options:
         aliases: []
 notes:
     - This module does not yet have support to add/remove checks.
+    - The checks are read with one listing request; checks already in the
+      requested state are left alone.
 '''
 
 EXAMPLES = '''
@@ -58,6 +70,13 @@ EXAMPLES = '''
            checkid=12345
            state=paused
 
+# Pause every check tagged "web" during maintenance.
+- pingdom: uid=example@example.com
+           passwd=password123
+           key=apipassword123
+           tags=web
+           state=paused
+
 # Unpause the check with the ID of 12345.
 - pingdom: uid=example@example.com
            passwd=password123
@@ -74,28 +93,50 @@ except:
 
 
 
-def pause(checkid, uid, passwd, key):
+def list_checks(c, checkids, tags):
+    """ Fetch the wanted checks with a single listing request. """
 
-    c = pingdom.PingdomConnection(uid, passwd, key)
-    c.modify_check(checkid, paused=True)
-    check = c.get_check(checkid)
-    name = check.name
-    result = check.status
-    #if result != "paused":             # api output buggy - accept raw exception for now
-    #    return (True, name, result)
-    return (False, name, result)
+    if tags:
+        checks = c.get_all_checks(tags=','.join(tags))
+    else:
+        checks = c.get_all_checks()
+    if checkids:
+        wanted = set(str(checkid) for checkid in checkids)
+        checks = [check for check in checks if str(check.id) in wanted]
+    return checks
 
 
-def unpause(checkid, uid, passwd, key):
+def set_paused(checkids, tags, paused, uid, passwd, key):
 
     c = pingdom.PingdomConnection(uid, passwd, key)
-    c.modify_check(checkid, paused=False)
-    check = c.get_check(checkid)
-    name = check.name
-    result = check.status
-    #if result != "up":                 # api output buggy - accept raw exception for now
-    #    return (True, name, result)
-    return (False, name, result)
+    checks = list_checks(c, checkids, tags)
+    found = set(str(check.id) for check in checks)
+    missing = [str(checkid) for checkid in (checkids or []) if str(checkid) not in found]
+    if missing:
+        # don't touch any check when some of them were mistyped
+        result = [dict(checkid=check.id, name=check.name, status=check.status) for check in checks]
+        return (True, False, result, missing)
+
+    todo = [check for check in checks if (check.status == 'paused') != paused]
+    if todo:
+        # the bulk form of PUT /checks takes a comma separated checkids list;
+        # pingdom-python has no public wrapper for it
+        c._make_request('checks', 'PUT', {
+            'checkids': ','.join(str(check.id) for check in todo),
+            'paused': paused and 'true' or 'false',
+        })
+        # report the status pingdom now has, with one more listing
+        checks = list_checks(c, [check.id for check in checks], None)
+    result = [dict(checkid=check.id, name=check.name, status=check.status) for check in checks]
+    return (False, bool(todo), result, missing)
+
+
+def pause(checkids, tags, uid, passwd, key):
+    return set_paused(checkids, tags, True, uid, passwd, key)
+
+
+def unpause(checkids, tags, uid, passwd, key):
+    return set_paused(checkids, tags, False, uid, passwd, key)
 
 
 def main():
@@ -103,32 +144,38 @@ def main():
     module = AnsibleModule(
         argument_spec=dict(
         state=dict(required=True, choices=['running', 'paused', 'started', 'stopped']),
-        checkid=dict(required=True),
+        checkid=dict(required=False, type='list'),
+        tags=dict(required=False, type='list'),
         uid=dict(required=True),
         passwd=dict(required=True),
         key=dict(required=True)
-        )
+        ),
+        required_one_of=[['checkid', 'tags']],
     )
 
     if not HAS_PINGDOM:
         module.fail_json(msg="Missing requried pingdom module (check docs)")
 
     checkid = module.params['checkid']
+    tags = module.params['tags']
     state = module.params['state']
     uid = module.params['uid']
     passwd = module.params['passwd']
     key = module.params['key']
 
     if (state == "paused" or state == "stopped"):
-        (rc, name, result) = pause(checkid, uid, passwd, key)
+        (rc, changed, checks, missing) = pause(checkid, tags, uid, passwd, key)
 
     if (state == "running" or state == "started"):
-        (rc, name, result) = unpause(checkid, uid, passwd, key)
+        (rc, changed, checks, missing) = unpause(checkid, tags, uid, passwd, key)
 
     if rc != 0:
-        module.fail_json(checkid=checkid, name=name, status=result)
+        module.fail_json(msg="checks not found: %s" % ', '.join(missing), checkid=checkid, checks=checks)
 
-    module.exit_json(checkid=checkid, name=name, status=result)
+    if len(checks) == 1:
+        module.exit_json(changed=changed, checkid=checks[0]['checkid'], name=checks[0]['name'],
+                         status=checks[0]['status'], checks=checks)
+    module.exit_json(changed=changed, checkid=checkid, checks=checks)
 
 # import module snippets
 from ansible.module_utils.basic import *
@@ -24,7 +24,7 @@ DOCUMENTATION = '''
 module: zabbix_maintenance
 short_description: Create Zabbix maintenance windows
 description:
-    - This module will let you create Zabbix maintenance windows.
+    - This module will let you create, update and remove Zabbix maintenance windows.
 version_added: "1.8"
 author: Alexander Bulimov
 requirements:
@@ -81,8 +81,18 @@ options:
     name:
         description:
             - Unique name of maintenance window.
-        required: true
+              One of C(name) or C(names) is required.
+        required: false
+        default: null
+    names:
+        description:
+            - Unique names of several maintenance windows, as a list or
+              separated by commas. They are all looked up with one API call
+              and get the same hosts, groups and period.
+              Mutually exclusive with C(name).
+        required: false
         default: null
+        version_added: "1.9"
     desc:
         description:
             - Short description of maintenance window.
@@ -93,6 +103,24 @@ options:
             - Type of maintenance. With data collection, or without.
         required: false
         default: "true"
+    session_cache:
+        description:
+            - Path of a local file where the API session token is kept
+              between runs, so that the (possibly slow) login is not
+              repeated for every task. When the cached session has
+              expired on the server the module logs in again and
+              refreshes the cache. Tokens are stored per server and user;
+              the password is never written.
+        required: false
+        default: null
+        version_added: "1.9"
+    session_ttl:
+        description:
+            - Seconds a cached session token is reused after its last use.
+              Keep it below the Zabbix frontend's session timeout.
+        required: false
+        default: 900
+        version_added: "1.9"
 notes:
     - Useful for setting hosts in maintenance mode before big update,
       and removing maintenance window after update.
@@ -100,7 +128,10 @@ notes:
       so if Zabbix server's time and host's time are not synchronized,
       you will get strange results.
     - Install required module with 'pip install zabbix-api' command.
-    - Checks existance only by maintenance name.
+    - Windows are identified by name. An existing window whose hosts,
+      groups, type or length differ from the requested ones, or which
+      has already ended, is updated in place with maintenance.update
+      rather than deleted and recreated.
 '''
 
 EXAMPLES = '''
@@ -134,6 +165,15 @@ EXAMPLES = '''
                       login_user=ansible
                       login_password=pAsSwOrD
 
+# Create or update maintenance windows for two racks
+- zabbix_maintenance: names="rack1,rack2"
+                      host_groups=Racks
+                      minutes=120
+                      state=present
+                      server_url=https://monitoring.example.com
+                      login_user=ansible
+                      login_password=pAsSwOrD
+
 # Remove maintenance window named "Test1"
 - zabbix_maintenance: name=Test1
                       state=absent
@@ -144,6 +184,13 @@ EXAMPLES = '''
 
 import datetime
 import time
+import os
+import tempfile
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
 
 try:
     from zabbix_api import ZabbixAPI
@@ -152,48 +199,123 @@ except ImportError:
     HAS_ZABBIX_API = False
 
 
-def create_maintenance(zbx, group_ids, host_ids, start_time, maintenance_type, period, name, desc):
+def load_session(path, key):
+    try:
+        f = open(path)
+        try:
+            sessions = json.load(f)
+        finally:
+            f.close()
+    except (IOError, OSError, ValueError):
+        return None
+
+    session = sessions.get(key)
+    if session and session.get("expires", 0) > time.time():
+        return session.get("auth")
+    return None
+
+
+def save_session(path, key, auth, ttl):
+    try:
+        f = open(path)
+        try:
+            sessions = json.load(f)
+        finally:
+            f.close()
+    except (IOError, OSError, ValueError):
+        sessions = {}
+
+    now = time.time()
+    sessions = dict((k, v) for k, v in sessions.items() if v.get("expires", 0) > now)
+    sessions[key] = {"auth": auth, "expires": now + ttl}
+    try:
+        # mkstemp creates the file readable by its owner only
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)))
+        f = os.fdopen(fd, "w")
+        try:
+            json.dump(sessions, f)
+        finally:
+            f.close()
+        os.rename(tmp, path)
+    except (IOError, OSError):
+        pass
+
+
+def is_session_error(error):
+    error = str(error).lower()
+    return "re-login" in error or "not authorised" in error or "not authorized" in error
+
+
+def maintenance_params(group_ids, host_ids, start_time, maintenance_type, period, name, desc):
     end_time = start_time + period
+    return {
+        "groupids": group_ids,
+        "hostids": host_ids,
+        "name": name,
+        "maintenance_type": maintenance_type,
+        "active_since": str(start_time),
+        "active_till": str(end_time),
+        "description": desc,
+        "timeperiods":  [{
+            "timeperiod_type": "0",
+            "start_date": str(start_time),
+            "period": str(period),
+        }]
+    }
+
+
+def create_maintenance(zbx, group_ids, host_ids, start_time, maintenance_type, period, name, desc):
     try:
         zbx.maintenance.create(
-            {
-                "groupids": group_ids,
-                "hostids": host_ids,
-                "name": name,
-                "maintenance_type": maintenance_type,
-                "active_since": str(start_time),
-                "active_till": str(end_time),
-                "description": desc,
-                "timeperiods":  [{
-                    "timeperiod_type": "0",
-                    "start_date": str(start_time),
-                    "period": str(period),
-                }]
-            }
+            maintenance_params(group_ids, host_ids, start_time, maintenance_type, period, name, desc)
         )
     except BaseException as e:
         return 1, None, str(e)
     return 0, None, None
 
 
-def get_maintenance_id(zbx, name):
+def update_maintenance(zbx, maintenance_id, group_ids, host_ids, start_time, maintenance_type, period, name, desc):
+    params = maintenance_params(group_ids, host_ids, start_time, maintenance_type, period, name, desc)
+    params["maintenanceid"] = maintenance_id
+    try:
+        zbx.maintenance.update(params)
+    except BaseException as e:
+        return 1, None, str(e)
+    return 0, None, None
+
+
+def get_maintenances(zbx, names):
     try:
         result = zbx.maintenance.get(
             {
+                "output": "extend",
+                "selectGroups": ["groupid"],
+                "selectHosts": ["hostid"],
+                "selectTimeperiods": "extend",
                 "filter":
                 {
-                    "name": name,
+                    "name": names,
                 }
             }
         )
     except BaseException as e:
         return 1, None, str(e)
 
-    maintenance_ids = []
-    for res in result:
-        maintenance_ids.append(res["maintenanceid"])
+    return 0, dict((res["name"], res) for res in result), None
+
 
-    return 0, maintenance_ids, None
+def maintenance_differs(maintenance, group_ids, host_ids, maintenance_type, period, now):
+    if set(g["groupid"] for g in maintenance.get("groups", [])) != set(group_ids):
+        return True
+    if set(h["hostid"] for h in maintenance.get("hosts", [])) != set(host_ids):
+        return True
+    if int(maintenance["maintenance_type"]) != maintenance_type:
+        return True
+    if int(maintenance["active_till"]) <= now:
+        # the window is over, open it again from now
+        return True
+    periods = maintenance.get("timeperiods", [])
+    return len(periods) != 1 or int(periods[0]["period"]) != period
 
 
 def delete_maintenance(zbx, maintenance_id):
@@ -204,64 +326,48 @@ def delete_maintenance(zbx, maintenance_id):
     return 0, None, None
 
 
-def check_maintenance(zbx, name):
+def get_group_ids(zbx, host_groups):
     try:
-        result = zbx.maintenance.exists(
+        result = zbx.hostgroup.get(
             {
-                "name": name
+                "output": ["groupid", "name"],
+                "filter":
+                {
+                    "name": host_groups
+                }
             }
         )
     except BaseException as e:
         return 1, None, str(e)
-    return 0, result, None
-
-
-def get_group_ids(zbx, host_groups):
-    group_ids = []
-    for group in host_groups:
-        try:
-            result = zbx.hostgroup.get(
-                {
-                    "output": "extend",
-                    "filter":
-                    {
-                        "name": group
-                    }
-                }
-            )
-        except BaseException as e:
-            return 1, None, str(e)
-
-        if not result:
-            return 1, None, "Group id for group %s not found" % group
 
-        group_ids.append(result[0]["groupid"])
+    found = dict((group["name"], group["groupid"]) for group in result)
+    missing = [group for group in host_groups if group not in found]
+    if missing:
+        return 1, None, "Group id for groups %s not found" % ", ".join(missing)
 
-    return 0, group_ids, None
+    return 0, [found[group] for group in host_groups], None
 
 
 def get_host_ids(zbx, host_names):
-    host_ids = []
-    for host in host_names:
-        try:
-            result = zbx.host.get(
+    try:
+        result = zbx.host.get(
+            {
+                "output": ["hostid", "name"],
+                "filter":
                 {
-                    "output": "extend",
-                    "filter":
-                    {
-                        "name": host
-                    }
+                    "name": host_names
                 }
-            )
-        except BaseException as e:
-            return 1, None, str(e)
-
-        if not result:
-            return 1, None, "Host id for host %s not found" % host
+            }
+        )
+    except BaseException as e:
+        return 1, None, str(e)
 
-        host_ids.append(result[0]["hostid"])
+    found = dict((host["name"], host["hostid"]) for host in result)
+    missing = [host for host in host_names if host not in found]
+    if missing:
+        return 1, None, "Host id for hosts %s not found" % ", ".join(missing)
 
-    return 0, host_ids, None
+    return 0, [found[host] for host in host_names], None
 
 
 def main():
@@ -274,10 +380,15 @@ def main():
             host_groups=dict(type='list', required=False, default=None, aliases=['host_group']),
             login_user=dict(required=True, default=None),
             login_password=dict(required=True, default=None),
-            name=dict(required=True, default=None),
+            name=dict(required=False, default=None),
+            names=dict(type='list', required=False, default=None),
             desc=dict(required=False, default="Created by Ansible"),
             collect_data=dict(type='bool', required=False, default=True),
+            session_cache=dict(required=False, default=None),
+            session_ttl=dict(type='int', required=False, default=900),
         ),
+        required_one_of=[['name', 'names']],
+        mutually_exclusive=[['name', 'names']],
         supports_check_mode=True,
     )
 
@@ -290,23 +401,46 @@ def main():
     login_user = module.params['login_user']
     login_password = module.params['login_password']
     minutes = module.params['minutes']
-    name = module.params['name']
+    # a single name is taken whole, commas and all
+    names = module.params['names'] or [module.params['name']]
     desc = module.params['desc']
     server_url = module.params['server_url']
     collect_data = module.params['collect_data']
+    session_cache = module.params['session_cache']
+    session_ttl = module.params['session_ttl']
+    session_key = "%s|%s" % (server_url, login_user)
     if collect_data:
         maintenance_type = 0
     else:
         maintenance_type = 1
 
+    cached_auth = None
     try:
         zbx = ZabbixAPI(server_url)
-        zbx.login(login_user, login_password)
+        if session_cache:
+            cached_auth = load_session(session_cache, session_key)
+        if cached_auth:
+            zbx.auth = cached_auth
+        else:
+            zbx.login(login_user, login_password)
     except BaseException as e:
         module.fail_json(msg="Failed to connect to Zabbix server: %s" % e)
 
     changed = False
 
+    (rc, maintenances, error) = get_maintenances(zbx, names)
+    if rc != 0 and cached_auth and is_session_error(error):
+        # the cached session expired on the server, start a new one
+        try:
+            zbx.login(login_user, login_password)
+        except BaseException as e:
+            module.fail_json(msg="Failed to connect to Zabbix server: %s" % e)
+        (rc, maintenances, error) = get_maintenances(zbx, names)
+    if session_cache and rc == 0:
+        save_session(session_cache, session_key, zbx.auth, session_ttl)
+    if rc != 0:
+        module.fail_json(msg="Failed to get maintenances %s: %s" % (", ".join(names), error))
+
     if state == "present":
 
         now = datetime.datetime.now()
@@ -327,43 +461,35 @@ def main():
         else:
             host_ids = []
 
-        (rc, exists, error) = check_maintenance(zbx, name)
-        if rc != 0:
-            module.fail_json(msg="Failed to check maintenance %s existance: %s" % (name, error))
+        for name in names:
+            maintenance = maintenances.get(name)
 
-        if not exists:
-            if not host_names and not host_groups:
-                module.fail_json(msg="At least one host_name or host_group must be defined for each created maintenance.")
+            if not maintenance:
+                if not host_names and not host_groups:
+                    module.fail_json(msg="At least one host_name or host_group must be defined for each created maintenance.")
 
-            if module.check_mode:
+                if not module.check_mode:
+                    (rc, _, error) = create_maintenance(zbx, group_ids, host_ids, start_time, maintenance_type, period, name, desc)
+                    if rc != 0:
+                        module.fail_json(msg="Failed to create maintenance: %s" % error)
                 changed = True
-            else:
-                (rc, _, error) = create_maintenance(zbx, group_ids, host_ids, start_time, maintenance_type, period, name, desc)
-                if rc == 0:
-                    changed = True
-                else:
-                    module.fail_json(msg="Failed to create maintenance: %s" % error)
 
-    if state == "absent":
+            elif (host_names or host_groups) and maintenance_differs(maintenance, group_ids, host_ids, maintenance_type, period, start_time):
+                if not module.check_mode:
+                    (rc, _, error) = update_maintenance(zbx, maintenance["maintenanceid"], group_ids, host_ids, start_time, maintenance_type, period, name, desc)
+                    if rc != 0:
+                        module.fail_json(msg="Failed to update maintenance: %s" % error)
+                changed = True
 
-        (rc, exists, error) = check_maintenance(zbx, name)
-        if rc != 0:
-            module.fail_json(msg="Failed to check maintenance %s existance: %s" % (name, error))
+    if state == "absent":
 
-        if exists:
-            (rc, maintenance, error) = get_maintenance_id(zbx, name)
-            if rc != 0:
-                module.fail_json(msg="Failed to get maintenance id: %s" % error)
-
-            if maintenance:
-                if module.check_mode:
-                    changed = True
-                else:
-                    (rc, _, error) = delete_maintenance(zbx, maintenance)
-                    if rc == 0:
-                        changed = True
-                    else:
-                        module.fail_json(msg="Failed to remove maintenance: %s" % error)
+        maintenance_ids = [maintenances[name]["maintenanceid"] for name in names if name in maintenances]
+        if maintenance_ids:
+            if not module.check_mode:
+                (rc, _, error) = delete_maintenance(zbx, maintenance_ids)
+                if rc != 0:
+                    module.fail_json(msg="Failed to remove maintenance: %s" % error)
+            changed = True
 
     module.exit_json(changed=changed)
 
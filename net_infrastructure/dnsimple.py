@@ -92,6 +92,29 @@ options:
     required: false
     default: null
 
+  records:
+    description:
+      - List of records to reconcile against the domain in one go. Each item is a hash with C(name), C(type) and C(value) keys and optional C(ttl) and C(priority) keys (C(ttl) defaults to I(ttl)).
+      - The zone is fetched once and compared against the whole list; with state=present missing records are created and records whose ttl or priority differ are updated, with state=absent the listed records are deleted.
+    required: false
+    default: null
+    version_added: "1.9"
+
+  purge:
+    description:
+      - With I(records) and state=present, also delete every record of the domain that is not in the list. SOA and NS records are never purged.
+    required: false
+    default: no
+    choices: [ 'yes', 'no' ]
+    version_added: "1.9"
+
+  concurrency:
+    description:
+      - Maximum number of API requests run in parallel when applying the changes computed for I(records).
+    required: false
+    default: 5
+    version_added: "1.9"
+
 requirements: [ dnsimple ]
 author: Alex Coomans
 '''
@@ -127,9 +150,22 @@ EXAMPLES = '''
 # and delete the record
 - local_action: dnsimpledomain=my.com record= type=CNAME value=example.com state=absent
 
+# make the zone contain exactly these records
+- local_action:
+    module: dnsimple
+    domain: my.com
+    state: present
+    purge: yes
+    records:
+      - { name: '', type: A, value: 127.0.0.1 }
+      - { name: www, type: CNAME, value: my.com, ttl: 600 }
+      - { name: '', type: MX, value: mail.my.com, priority: 10 }
+
 '''
 
 import os
+import threading
+import Queue
 try:
     from dnsimple import DNSimple
     from dnsimple.dnsimple import DNSimpleException
@@ -137,6 +173,98 @@ except ImportError:
     print "failed=True msg='dnsimple required for this module'"
     sys.exit(1)
 
+def run_parallel(func, items, concurrency):
+    """ Call func on every item using at most concurrency worker threads.
+    Returns a list of (item, result, exception) in the order of items. """
+    jobs = Queue.Queue()
+    results = [None] * len(items)
+    for i, item in enumerate(items):
+        jobs.put((i, item))
+
+    def worker():
+        while True:
+            try:
+                i, item = jobs.get_nowait()
+            except Queue.Empty:
+                return
+            try:
+                results[i] = (item, func(item), None)
+            except Exception, e:
+                results[i] = (item, None, e)
+
+    threads = [threading.Thread(target=worker) for _ in range(max(1, min(concurrency, len(items))))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+def reconcile_records(module, client, domain, wanted, state, purge, default_ttl, concurrency):
+    """ Diff the wanted records against a single snapshot of the zone and
+    apply the creates, updates and deletes through a small thread pool. """
+    index = {}
+    for r in client.records(str(domain)):
+        r = r['record']
+        index[(r['name'], r['record_type'], r['content'])] = r
+
+    to_create, to_update, to_delete = [], [], []
+    seen = set()
+    for item in wanted:
+        for key in ('name', 'type', 'value'):
+            if item.get(key) is None:
+                module.fail_json(msg="Every entry of records needs a '%s' key: %s" % (key, item))
+        key = (str(item['name']), item['type'], str(item['value']))
+        seen.add(key)
+        current = index.get(key)
+        if state == 'absent':
+            if current:
+                to_delete.append(current)
+            continue
+
+        ttl = int(item.get('ttl') or default_ttl)
+        priority = item.get('priority')
+        if priority is not None:
+            priority = int(priority)
+        if current is None:
+            data = {'name': key[0], 'record_type': key[1], 'content': key[2], 'ttl': ttl}
+            if priority: data['prio'] = priority
+            to_create.append(data)
+        elif current['ttl'] != ttl or (priority is not None and current['prio'] != priority):
+            data = {'ttl': ttl}
+            if priority: data['prio'] = priority
+            to_update.append((current, data))
+
+    if state == 'present' and purge:
+        to_delete.extend(r for k, r in index.items() if k not in seen and r['record_type'] not in ('SOA', 'NS'))
+
+    diff = dict(
+        created=to_create,
+        updated=[dict(current, **data) for current, data in to_update],
+        deleted=to_delete,
+    )
+    changed = bool(to_create or to_update or to_delete)
+    if module.check_mode or not changed:
+        return changed, diff
+
+    ops = [('create', data) for data in to_create]
+    ops += [('update', u) for u in to_update]
+    ops += [('delete', r) for r in to_delete]
+
+    def apply(op):
+        action, arg = op
+        if action == 'create':
+            return client.add_record(str(domain), arg)['record']
+        if action == 'update':
+            return client.update_record(str(domain), str(arg[0]['id']), arg[1])['record']
+        return client.delete_record(str(domain), arg['id'])
+
+    results = run_parallel(apply, ops, concurrency)
+    errors = ["%s %s: %s" % (op[0], op[1], getattr(e, 'message', e) or e) for op, result, e in results if e]
+    if errors:
+        module.fail_json(msg="Failed to apply %d of %d record changes" % (len(errors), len(ops)), errors=errors, **diff)
+    diff['created'] = [result for (op, result, e) in results if op[0] == 'create']
+    return changed, diff
+
 def main():
     module = AnsibleModule(
         argument_spec = dict(
@@ -151,10 +279,16 @@ def main():
             priority          = dict(required=False, type='int'), 
             state             = dict(required=False, choices=['present', 'absent']),
             solo              = dict(required=False, type='bool'),
+            records           = dict(required=False, type='list'),
+            purge             = dict(required=False, default=False, type='bool'),
+            concurrency       = dict(required=False, default=5, type='int'),
         ),
         required_together = (
             ['record', 'value']
         ),
+        mutually_exclusive = [
+            ['records', 'record'], ['records', 'record_ids'],
+        ],
         supports_check_mode = True,
     )
 
@@ -169,6 +303,9 @@ def main():
     priority          = module.params.get('priority')
     state             = module.params.get('state')
     is_solo           = module.params.get('solo')
+    records_wanted    = module.params.get('records')
+    purge             = module.params.get('purge')
+    concurrency       = module.params.get('concurrency')
 
     if account_email and account_api_token:
         client = DNSimple(email=account_email, api_token=account_api_token)
@@ -185,6 +322,13 @@ def main():
             domains = client.domains()
             module.exit_json(changed=False, result=[d['domain'] for d in domains])
 
+        # Reconcile a whole list of records from one zone snapshot
+        if domain and records_wanted is not None:
+            if state not in ('present', 'absent'):
+                module.fail_json(msg="'%s' is an unknown value for the state argument" % state)
+            changed, diff = reconcile_records(module, client, domain, records_wanted, state, purge, ttl, concurrency)
+            module.exit_json(changed=changed, **diff)
+
         # Domain & No record
         if domain and record is None and not record_ids:
             domains = [d['domain'] for d in client.domains()]
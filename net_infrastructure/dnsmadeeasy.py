@@ -82,9 +82,27 @@ options:
     choices: ['yes', 'no']
     version_added: 1.5.1
 
+  record_set:
+    description:
+      - Treat the records of this name and type as a set (e.g. round-robin A or MX records). A record_value that matches none of them is added as a new record, instead of replacing the value of a lone existing record.
+    required: false
+    default: 'no'
+    choices: ['yes', 'no']
+    version_added: "1.9"
+
+  rate_limit_retries:
+    description:
+      - Number of times a request is retried, with a jittered exponential backoff, when the API reports that the account's request limit has been exceeded.
+    required: false
+    default: 5
+    version_added: "1.9"
+
 notes:
   - The DNS Made Easy service requires that machines interacting with the API have the proper time and timezone set. Be sure you are within a few seconds of actual time by using NTP. 
-  - This module returns record(s) in the "result" element when 'state' is set to 'present'. This value can be be registered and used in your playbooks.
+  - This module returns record(s) in the "result" element when 'state' is set to 'present'. This value can be be registered and used in your playbooks. Fetching a name (and type) with several records returns them all as a list.
+  - "A lone record of the given name (and type) gets its value updated in place, as in earlier versions. When several records share a name and type, the one with the given record_value is managed; a value that matches none of them is only added with record_set=yes, otherwise the task fails rather than guess which record to change."
+  - "With state=absent, the record_value record is removed; without a value, every record of that name and record_type is removed. Without either, the name must have a single record."
+  - Requests are paced according to the request limit headers returned by the API, so many hosts managing records in parallel slow down instead of failing once the account's limit is reached.
   
 requirements: [ urllib, urllib2, hashlib, hmac ]
 author: Brice Burgess
@@ -107,6 +125,15 @@ EXAMPLES = '''
   
 # delete a record / ensure it is absent
 - dnsmadeeasy: account_key=key account_secret=secret domain=my.com state=absent record_name="test"
+
+# delete every TXT record of a name
+- dnsmadeeasy: account_key=key account_secret=secret domain=my.com state=absent record_name="test" record_type="TXT"
+
+# add a second address to a round-robin A record set
+- dnsmadeeasy: account_key=key account_secret=secret domain=my.com state=present record_name="www" record_type="A" record_value="192.168.0.2" record_set=yes
+
+# remove a single address from that set
+- dnsmadeeasy: account_key=key account_secret=secret domain=my.com state=absent record_name="www" record_type="A" record_value="192.168.0.1"
 '''
 
 # ============================================
@@ -116,23 +143,71 @@ EXAMPLES = '''
 IMPORT_ERROR = None
 try:
     import json
-    from time import strftime, gmtime
+    from time import strftime, gmtime, sleep, time
     import hashlib
     import hmac
+    import random
 except ImportError, e:
     IMPORT_ERROR = str(e)
 
+RECORD_TYPES = ['A', 'AAAA', 'CNAME', 'HTTPRED', 'MX', 'NS', 'PTR', 'SRV', 'TXT']
+
+class TokenBucket:
+    """ Paces API requests against the account's request limit.
+
+    DNS Made Easy allows ``x-dnsme-requestLimit`` requests per rolling
+    window and reports what is left of it in ``x-dnsme-requestsRemaining``
+    on every response; the bucket refills at limit/window tokens per second
+    and is re-synchronised with the server's count after each request.
+    """
+
+    def __init__(self, limit=150, window=300):
+        self.window = float(window)
+        self.limit = limit
+        self.remaining = None
+        self.tokens = float(limit)
+        self.stamp = time()
+
+    def _refill(self):
+        now = time()
+        rate = self.limit / self.window
+        self.tokens = min(float(self.limit), self.tokens + (now - self.stamp) * rate)
+        self.stamp = now
+
+    def take(self):
+        self._refill()
+        if self.tokens < 1:
+            rate = self.limit / self.window
+            sleep((1 - self.tokens) / rate)
+            self._refill()
+        self.tokens -= 1
+
+    def update(self, limit, remaining):
+        if limit:
+            self.limit = limit
+        if remaining is not None:
+            self.remaining = remaining
+            self._refill()
+            self.tokens = min(self.tokens, float(remaining))
+
+    def drain(self):
+        self.tokens = 0.0
+        self.stamp = time()
+
+
 class DME2:
 
     def __init__(self, apikey, secret, domain, module):
         self.module = module
+        self.bucket = TokenBucket()
+        self.retries = module.params.get('rate_limit_retries', 5)
 
         self.api = apikey
         self.secret = secret
         self.baseurl = 'https://api.dnsmadeeasy.com/V2.0/'
         self.domain = str(domain)
         self.domain_map = None      # ["domain_name"] => ID
-        self.record_map = None      # ["record_name"] => ID
+        self.record_map = None      # [("record_name", "record_type")] => [IDs]
         self.records = None         # ["record_ID"] => <record>
 
         # Lookup the domain ID if passed as a domain name vs. ID
@@ -161,15 +236,45 @@ class DME2:
         if data and not isinstance(data, basestring):
             data = urllib.urlencode(data)
 
-        response, info = fetch_url(self.module, url, data=data, method=method, headers=self._headers())
-        if info['status'] not in (200, 201, 204):
-            self.module.fail_json(msg="%s returned %s, with body: %s" % (url, info['status'], info['msg']))
+        attempt = 0
+        while True:
+            self.bucket.take()
+            response, info = fetch_url(self.module, url, data=data, method=method, headers=self._headers())
+            self._update_limits(info)
+            if info['status'] in (200, 201, 204):
+                break
+            if not self._rate_limited(info) or attempt >= self.retries:
+                self.module.fail_json(msg="%s returned %s, with body: %s" % (url, info['status'], info['msg']))
+
+            # back off with full jitter so parallel hosts don't retry in lockstep
+            self.bucket.drain()
+            sleep(random.uniform(0, min(60, 2 ** attempt)))
+            attempt += 1
 
         try:
             return json.load(response)
         except Exception, e:
             return {}
 
+    def _update_limits(self, info):
+        def header(name):
+            try:
+                return int(info.get(name))
+            except (TypeError, ValueError):
+                return None
+
+        self.bucket.update(header('x-dnsme-requestlimit'), header('x-dnsme-requestsremaining'))
+
+    def _rate_limited(self, info):
+        if info['status'] == 429:
+            return True
+        if info['status'] != 400:
+            return False
+        # older fetch_url() drops the body and headers of error responses,
+        # so fall back on the last remaining-requests count we were sent
+        body = str(info.get('body', '')) + str(info.get('msg', ''))
+        return 'rate limit' in body.lower() or self.bucket.remaining == 0
+
     def getDomain(self, domain_id):
         if not self.domain_map:
             self._instMap('domain')
@@ -191,11 +296,25 @@ class DME2:
 
         return self.records.get(record_id, False)
 
-    def getRecordByName(self, record_name):
-        if not self.record_map:
+    def getRecordByName(self, record_name, record_type=None, record_value=None):
+        records = self.getRecordsByName(record_name, record_type)
+        if record_value is not None:
+            records = [r for r in records if str(r['value']) == str(record_value)]
+
+        return records and records[0] or False
+
+    def getRecordsByName(self, record_name, record_type=None):
+        if self.record_map is None:
             self._instMap('record')
 
-        return self.getRecord(self.record_map.get(record_name, 0))
+        if record_type:
+            ids = self.record_map.get((record_name, record_type), [])
+        else:
+            ids = []
+            for (name, rtype), record_ids in self.record_map.items():
+                if name == record_name:
+                    ids.extend(record_ids)
+        return [self.getRecord(i) for i in sorted(ids)]
 
     def getRecords(self):
         return self.query(self.record_url, 'GET')['data']
@@ -208,7 +327,11 @@ class DME2:
         # iterate over e.g. self.getDomains() || self.getRecords()
         for result in getattr(self, 'get' + type.title() + 's')():
 
-            map[result['name']] = result['id']
+            if type == 'record':
+                # several records may share a name (round-robin A, MX, ...)
+                map.setdefault((result['name'], result['type']), []).append(result['id'])
+            else:
+                map[result['name']] = result['id']
             results[result['id']] = result
 
         # e.g. self.domain_map || self.record_map
@@ -244,11 +367,12 @@ def main():
             domain=dict(required=True),
             state=dict(required=True, choices=['present', 'absent']),
             record_name=dict(required=False),
-            record_type=dict(required=False, choices=[
-                             'A', 'AAAA', 'CNAME', 'HTTPRED', 'MX', 'NS', 'PTR', 'SRV', 'TXT']),
+            record_type=dict(required=False, choices=RECORD_TYPES),
             record_value=dict(required=False),
             record_ttl=dict(required=False, default=1800, type='int'),
             validate_certs = dict(default='yes', type='bool'),
+            record_set = dict(default='no', type='bool'),
+            rate_limit_retries = dict(default=5, type='int'),
         ),
         required_together=(
             ['record_value', 'record_ttl', 'record_type']
@@ -272,7 +396,22 @@ def main():
         module.exit_json(changed=False, result=domain_records)
 
     # Fetch existing record + Build new one
-    current_record = DME.getRecordByName(record_name)
+    record_type = module.params["record_type"]
+    record_value = module.params["record_value"]
+    candidates = DME.getRecordsByName(record_name, record_type)
+
+    # an exact value match within a set (round-robin A, MX, ...) wins; a
+    # lone record is updated in place unless the value is to join the set
+    current_record = False
+    if record_value:
+        current_record = DME.getRecordByName(record_name, record_type, record_value)
+    if not current_record and candidates and not (module.params["record_set"] and record_value):
+        if len(candidates) == 1:
+            current_record = candidates[0]
+        elif state == 'present' and record_value:
+            module.fail_json(
+                msg="'%s' has %d records and none has value '%s'; use record_set=yes to add it." % (
+                    record_name, len(candidates), record_value))
     new_record = {'name': record_name}
     for i in ["record_value", "record_type", "record_ttl"]:
         if module.params[i]:
@@ -290,6 +429,8 @@ def main():
     if state == 'present':
         # return the record if no value is specified
         if not "value" in new_record:
+            if len(candidates) > 1:
+                module.exit_json(changed=False, result=candidates)
             if not current_record:
                 module.fail_json(
                     msg="A record with name '%s' does not exist for domain '%s.'" % (record_name, domain))
@@ -310,9 +451,18 @@ def main():
         module.exit_json(changed=False, result=current_record)
 
     elif state == 'absent':
-        # delete the record if it exists
-        if current_record:
-            DME.deleteRecord(current_record['id'])
+        # delete the matching record(s) if they exist; without a value every
+        # record of that name and type goes
+        if record_value:
+            doomed = [r for r in candidates if str(r['value']) == str(record_value)]
+        elif record_type or len(candidates) < 2:
+            doomed = candidates
+        else:
+            module.fail_json(
+                msg="'%s' has %d records; give record_type or record_value to choose what to delete." % (record_name, len(candidates)))
+        for record in doomed:
+            DME.deleteRecord(record['id'])
+        if doomed:
             module.exit_json(changed=True)
 
         # record does not exist, return w/o change.
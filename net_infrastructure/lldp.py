@@ -14,7 +14,15 @@
 # You should have received a copy of the GNU General Public License
 # along with Ansible.  If not, see <http://www.gnu.org/licenses/>.
 
-import subprocess
+import os
+import stat
+import time
+import tempfile
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
 
 DOCUMENTATION = '''
 ---
@@ -23,7 +31,32 @@ version_added: 1.6
 short_description: get details reported by lldp
 description:
   - Reads data out of lldpctl
-options: {}
+options:
+  interfaces:
+    description:
+      - Only gather neighbour data for these local interfaces. By default every interface known to lldpd is reported.
+    required: false
+    default: null
+    version_added: "1.9"
+  format:
+    description:
+      - Output format requested from lldpctl. C(auto) uses the structured C(json) format when lldpctl supports it and falls back to C(keyvalue) otherwise. The facts have the same layout whichever format is used.
+    required: false
+    default: auto
+    choices: [ 'auto', 'json', 'keyvalue' ]
+    version_added: "1.9"
+  cache_ttl:
+    description:
+      - Number of seconds neighbour data is reused from I(cache_file) before lldpctl is run again. Entries are kept per interface, so a run filtered on I(interfaces) only queries the interfaces that are missing or stale. C(0) disables the cache.
+    required: false
+    default: 60
+    version_added: "1.9"
+  cache_file:
+    description:
+      - Path of the on-disk cache used with I(cache_ttl). The file is ignored unless it is owned by the user running the module and writable by no one else.
+    required: false
+    default: ~/.ansible/lldp-cache.json
+    version_added: "1.9"
 author: Andy Hill
 notes:
   - Requires lldpd running and lldp enabled on switches 
@@ -43,41 +76,182 @@ EXAMPLES = '''
 # ok: [10.13.0.22] => (item=eth1) => {"item": "eth1", "msg": "switch2.example.com / Gi0/3"}
 # ok: [10.13.0.22] => (item=eth0) => {"item": "eth0", "msg": "switch3.example.com / Gi0/3"}
 
+# Only look at the uplinks and always ask lldpd
+ - lldp: interfaces=eth0,eth1 cache_ttl=0
+
 '''
 
-def gather_lldp():
-    cmd = ['lldpctl', '-f', 'keyvalue']
-    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE)
-    (output, err) = proc.communicate()
-    if output:
-        output_dict = {}
-        lldp_entries = output.split("\n")
-
-        for entry in lldp_entries:
-            if entry:
-                path, value = entry.strip().split("=", 1)
-                path = path.split(".")
-                path_components, final = path[:-1], path[-1]
-
-            current_dict = output_dict
-            for path_component in path_components:
-                current_dict[path_component] = current_dict.get(path_component, {})
-                current_dict = current_dict[path_component]
-            current_dict[final] = value
-        return output_dict
-            
+# fields lldpctl nests under a chassis or port; anything else found as the
+# only key of a chassis in json output is the neighbour's system name
+CHASSIS_FIELDS = ('id', 'name', 'descr', 'mgmt-ip', 'capability')
 
-def main():
-    module = AnsibleModule({})
+def parse_keyvalue(output):
+    """ Turn `lldpctl -f keyvalue` output into {interface: {...}}. """
+    interfaces = {}
+    for entry in output.splitlines():
+        if '=' not in entry:
+            continue
+        path, value = entry.strip().split("=", 1)
+        path = path.split(".")
+        # path[0] is always "lldp", path[1] the local interface
+        if len(path) < 3:
+            continue
+        current = interfaces.setdefault(path[1], {})
+        for component in path[2:-1]:
+            child = current.get(component)
+            if not isinstance(child, dict):
+                child = current[component] = {}
+            current = child
+        current[path[-1]] = value
+    return interfaces
+
+def _normalize(key, node):
+    """ Reshape a node of `lldpctl -f json` output to match keyvalue. """
+    if key == 'capability' and isinstance(node, dict):
+        node = [node]
+    if isinstance(node, list):
+        if key == 'capability':
+            return dict((c['type'], {'enabled': c.get('enabled') and 'on' or 'off'}) for c in node)
+        # repeated keys: keyvalue output keeps the last one
+        node = node[-1]
+    if not isinstance(node, dict):
+        if isinstance(node, bool):
+            return node and 'yes' or 'no'
+        return node
+
+    if key == 'chassis' and len(node) == 1:
+        name, value = list(node.items())[0]
+        if name not in CHASSIS_FIELDS and isinstance(value, dict):
+            node = dict(value, name=name)
+
+    result = {}
+    for k, v in node.items():
+        if isinstance(v, dict) and set(v.keys()) == set(['type', 'value']):
+            # "id": {"type": "mac", "value": ...} is "mac=..." in keyvalue
+            result[v['type']] = v['value']
+        elif isinstance(v, dict) and set(v.keys()) == set(['value']):
+            result[k] = v['value']
+        elif k == 'capability':
+            # keyvalue has "chassis.Bridge.enabled=on", no capability level
+            result.update(_normalize(k, v))
+        else:
+            result[k] = _normalize(k, v)
+    return result
+
+def parse_json(output):
+    """ Turn `lldpctl -f json` output into {interface: {...}}. """
+    interfaces = {}
+    entries = json.loads(output).get('lldp', {}).get('interface', [])
+    if isinstance(entries, dict):
+        entries = [entries]
+    for entry in entries:
+        for name, data in entry.items():
+            interfaces[name] = _normalize(name, data)
+    return interfaces
+
+PARSERS = {'json': parse_json, 'keyvalue': parse_keyvalue}
+
+def gather_lldp(module, interfaces=None, fmt='auto'):
+    formats = fmt == 'auto' and ['json', 'keyvalue'] or [fmt]
+    for f in formats:
+        cmd = ['lldpctl', '-f', f] + list(interfaces or [])
+        rc, out, err = module.run_command(cmd)
+        if rc != 0:
+            # old lldpctl builds have no json writer
+            continue
+        try:
+            return PARSERS[f](out)
+        except ValueError:
+            continue
+    return None
+
+def load_cache(path):
+    try:
+        f = open(path)
+        try:
+            # anyone else able to write it could plant neighbours
+            st = os.fstat(f.fileno())
+            if st.st_uid != os.geteuid() or st.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+                return {}
+            return json.load(f)
+        finally:
+            f.close()
+    except (IOError, OSError, ValueError):
+        return {}
 
-    lldp_output = gather_lldp()
+def save_cache(path, cache):
     try:
-        data = {'lldp': lldp_output['lldp']}
-        module.exit_json(ansible_facts=data)
-    except TypeError:
-        module.fail_json(msg="lldpctl command failed. is lldpd running?")    
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory, 0o700)
+        fd, tmp = tempfile.mkstemp(prefix='.ansible-lldp', dir=os.path.dirname(path) or '.')
+        f = os.fdopen(fd, 'w')
+        try:
+            json.dump(cache, f)
+        finally:
+            f.close()
+        os.rename(tmp, path)
+    except (IOError, OSError):
+        # the cache is only an optimisation
+        pass
+
+def cached_lldp(module, interfaces, fmt, ttl, path):
+    now = time.time()
+    cache = load_cache(path)
+    entries = cache.get('interfaces', {})
+    # entries from the future are as suspect as old ones
+    recent = lambda t: 0 <= now - t < ttl
+    fresh = lambda e: e and recent(e.get('time', 0))
+
+    if interfaces:
+        stale = [i for i in interfaces if not fresh(entries.get(i))]
+    elif recent(cache.get('full', 0)):
+        stale = []
+    else:
+        stale = None
+
+    if stale is None or stale:
+        output = gather_lldp(module, stale, fmt)
+        if output is None:
+            return None
+        if stale is None:
+            entries = {}
+            cache['full'] = now
+        # remember interfaces without neighbours too
+        for name in (stale or []):
+            entries[name] = {'time': now, 'data': None}
+        for name, data in output.items():
+            entries[name] = {'time': now, 'data': data}
+        cache['interfaces'] = entries
+        save_cache(path, cache)
+
+    wanted = interfaces or entries.keys()
+    return dict((i, entries[i]['data']) for i in wanted if i in entries and entries[i]['data'] is not None)
+
+def main():
+    module = AnsibleModule(
+        argument_spec = dict(
+            interfaces = dict(required=False, type='list'),
+            format     = dict(required=False, default='auto', choices=['auto', 'json', 'keyvalue']),
+            cache_ttl  = dict(required=False, default=60, type='int'),
+            cache_file = dict(required=False, default='~/.ansible/lldp-cache.json'),
+        ),
+        supports_check_mode = True,
+    )
+
+    interfaces = module.params['interfaces']
+    fmt = module.params['format']
+    ttl = module.params['cache_ttl']
+
+    if ttl > 0:
+        lldp_output = cached_lldp(module, interfaces, fmt, ttl, os.path.expanduser(module.params['cache_file']))
+    else:
+        lldp_output = gather_lldp(module, interfaces, fmt)
+
+    if lldp_output is None:
+        module.fail_json(msg="lldpctl command failed. is lldpd running?")
+    module.exit_json(ansible_facts={'lldp': lldp_output})
    
 # import module snippets
 from ansible.module_utils.basic import *
 main()
-
@@ -18,6 +18,11 @@
 # You should have received a copy of the GNU General Public License
 # along with this software.  If not, see <http://www.gnu.org/licenses/>.
 
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
 DOCUMENTATION = '''
 ---
 module: openvswitch_bridge
@@ -43,74 +48,206 @@ options:
         default: 5
         description:
             - How long to wait for ovs-vswitchd to respond
+    ports:
+        required: false
+        version_added: "1.9"
+        description:
+            - Ports the bridge should have. Each item is either a port name
+              or a hash with C(name) and an optional VLAN C(tag). When given,
+              ports on the bridge that are not listed are removed.
+    tag:
+        required: false
+        version_added: "1.9"
+        description:
+            - VLAN tag of the bridge's own internal port.
+    fail_mode:
+        required: false
+        version_added: "1.9"
+        choices: [ standalone, secure ]
+        description:
+            - Fail mode of the bridge.
+    external_ids:
+        required: false
+        version_added: "1.9"
+        description:
+            - Hash of external_ids keys to set on the bridge. Keys that are
+              not listed are left alone.
+notes:
+    - The current state is read with a single C(ovs-vsctl --format=json)
+      call and every difference is applied in one OVSDB transaction.
 '''
 
 EXAMPLES = '''
 # Create a bridge named br-int
 - openvswitch_bridge: bridge=br-int state=present
+
+# Create br-ex in secure mode with its uplink and a tagged port
+- openvswitch_bridge:
+    bridge: br-ex
+    fail_mode: secure
+    external_ids:
+      bridge-id: br-ex
+    ports:
+      - eth2
+      - { name: vlan100, tag: 100 }
 '''
 
 
+def _cell(value):
+    '''Convert an OVSDB JSON cell to plain Python values'''
+    if isinstance(value, list) and len(value) == 2:
+        kind, data = value
+        if kind == 'set':
+            return [_cell(v) for v in data]
+        if kind == 'map':
+            return dict((_cell(k), _cell(v)) for k, v in data)
+        if kind in ('uuid', 'named-uuid'):
+            return data
+    return value
+
+
+def _as_list(value):
+    '''OVSDB encodes a one element set as the element itself'''
+    if isinstance(value, list):
+        return value
+    return [value]
+
+
+def _rows(output):
+    '''Yield every row of the tables printed by ovs-vsctl --format=json'''
+    decoder = json.JSONDecoder()
+    pos = 0
+    output = output.strip()
+    while pos < len(output):
+        table, pos = decoder.raw_decode(output, pos)
+        while pos < len(output) and output[pos].isspace():
+            pos += 1
+        headings = table['headings']
+        for row in table['data']:
+            yield dict(zip(headings, [_cell(v) for v in row]))
+
+
 class OVSBridge(object):
     def __init__(self, module):
         self.module = module
         self.bridge = module.params['bridge']
         self.state = module.params['state']
         self.timeout = module.params['timeout']
+        self.ports = self._ports(module.params['ports'])
+        self.tag = module.params['tag']
+        self.fail_mode = module.params['fail_mode']
+        self.external_ids = module.params['external_ids'] or {}
+
+    def _ports(self, ports):
+        '''Normalise the ports option to {name: tag}'''
+        if ports is None:
+            return None
+        wanted = {}
+        for port in ports:
+            if isinstance(port, dict):
+                if 'name' not in port:
+                    self.module.fail_json(msg="port entries need a name: %s" % port)
+                tag = port.get('tag')
+                wanted[str(port['name'])] = tag is not None and int(tag) or None
+            else:
+                wanted[str(port)] = None
+        return wanted
 
     def _vsctl(self, command):
         '''Run ovs-vsctl command'''
         return self.module.run_command(['ovs-vsctl', '-t', str(self.timeout)] + command)
 
-    def exists(self):
-        '''Check if the bridge already exists'''
-        rc, _, err = self._vsctl(['br-exists', self.bridge])
-        if rc == 0:  # See ovs-vsctl(8) for status codes
-            return True
-        if rc == 2:
-            return False
-        raise Exception(err)
-
-    def add(self):
-        '''Create the bridge'''
-        rc, _, err = self._vsctl(['add-br', self.bridge])
+    def read(self):
+        '''Return the bridge and its ports as they are now, or None'''
+        rc, out, err = self._vsctl(['--format=json', '--', 'find', 'Bridge',
+                                    'name=%s' % self.bridge, '--', 'list', 'Port'])
         if rc != 0:
             raise Exception(err)
+        bridge = None
+        ports = {}
+        for row in _rows(out):
+            if 'fail_mode' in row:
+                bridge = row
+            else:
+                ports[row['_uuid']] = row
+        if bridge is None:
+            return None
+
+        tags = {}
+        for uuid in _as_list(bridge['ports']):
+            port = ports.get(uuid)
+            if port:
+                tag = _as_list(port['tag'])
+                tags[port['name']] = tag and int(tag[0]) or None
+        return {
+            'ports': tags,
+            'fail_mode': (_as_list(bridge['fail_mode']) or [None])[0],
+            'external_ids': bridge['external_ids'] or {},
+        }
+
+    def changes(self, current):
+        '''Return the ovs-vsctl commands turning current into the wanted state'''
+        if self.state == 'absent':
+            return current and [['del-br', self.bridge]] or []
 
-    def delete(self):
-        '''Delete the bridge'''
-        rc, _, err = self._vsctl(['del-br', self.bridge])
+        commands = []
+        if current is None:
+            commands.append(['add-br', self.bridge])
+            current = {'ports': {self.bridge: None}, 'fail_mode': None, 'external_ids': {}}
+
+        if self.fail_mode and self.fail_mode != current['fail_mode']:
+            commands.append(['set-fail-mode', self.bridge, self.fail_mode])
+
+        for key, value in sorted(self.external_ids.items()):
+            if current['external_ids'].get(key) != str(value):
+                commands.append(['br-set-external-id', self.bridge, key, str(value)])
+
+        wanted = current['ports'].copy()
+        if self.ports is not None:
+            wanted = dict(self.ports)
+            wanted.setdefault(self.bridge, current['ports'].get(self.bridge))
+        if self.tag is not None:
+            wanted[self.bridge] = self.tag
+
+        for port in sorted(current['ports']):
+            if port not in wanted:
+                commands.append(['del-port', self.bridge, port])
+        for port, tag in sorted(wanted.items()):
+            if port not in current['ports']:
+                commands.append(['add-port', self.bridge, port] + (tag and ['tag=%d' % tag] or []))
+            elif tag != current['ports'][port]:
+                if tag:
+                    commands.append(['set', 'Port', port, 'tag=%d' % tag])
+                else:
+                    commands.append(['clear', 'Port', port, 'tag'])
+        return commands
+
+    def apply(self, commands):
+        '''Run all commands as one OVSDB transaction'''
+        transaction = []
+        for command in commands:
+            transaction += ['--'] + command
+        rc, _, err = self._vsctl(transaction)
         if rc != 0:
             raise Exception(err)
 
     def check(self):
         '''Run check mode'''
         try:
-            if self.state == 'absent' and self.exists():
-                changed = True
-            elif self.state == 'present' and not self.exists():
-                changed = True
-            else:
-                changed = False
+            commands = self.changes(self.read())
         except Exception, e:
             self.module.fail_json(msg=str(e))
-        self.module.exit_json(changed=changed)
+        self.module.exit_json(changed=bool(commands), commands=[' '.join(c) for c in commands])
 
     def run(self):
         '''Make the necessary changes'''
-        changed = False
         try:
-            if self.state == 'absent':
-                if self.exists():
-                    self.delete()
-                    changed = True
-            elif self.state == 'present':
-                if not self.exists():
-                    self.add()
-                    changed = True
+            commands = self.changes(self.read())
+            if commands:
+                self.apply(commands)
         except Exception, e:
             self.module.fail_json(msg=str(e))
-        self.module.exit_json(changed=changed)
+        self.module.exit_json(changed=bool(commands), commands=[' '.join(c) for c in commands])
 
 
 def main():
@@ -118,7 +255,11 @@ def main():
         argument_spec={
             'bridge': {'required': True},
             'state': {'default': 'present', 'choices': ['present', 'absent']},
-            'timeout': {'default': 5, 'type': 'int'}
+            'timeout': {'default': 5, 'type': 'int'},
+            'ports': {'required': False, 'type': 'list'},
+            'tag': {'required': False, 'type': 'int'},
+            'fail_mode': {'required': False, 'choices': ['standalone', 'secure']},
+            'external_ids': {'required': False, 'type': 'dict'},
         },
         supports_check_mode=True,
     )
@@ -33,15 +33,22 @@ options:
         description:
             - Name of bridge to manage
     port:
-        required: true
+        required: false
         description:
-            - Name of port to manage on the bridge
+            - Name of port to manage on the bridge. Either I(port) or I(ports) is required.
+    ports:
+        required: false
+        version_added: "1.9"
+        description:
+            - List of ports to manage on the bridge. The bridge's ports are
+              read once and every addition or removal is applied in a single
+              ovs-vsctl transaction.
     state:
         required: false
         default: "present"
         choices: [ present, absent ]
         description:
-            - Whether the port should exist
+            - Whether the port(s) should exist
     timeout:
         required: false
         default: 5
@@ -52,6 +59,9 @@ options:
 EXAMPLES = '''
 # Creates port eth2 on bridge br-ex
 - openvswitch_port: bridge=br-ex port=eth2 state=present
+
+# Creates several tap ports on br-int in one transaction
+- openvswitch_port: bridge=br-int ports=tap0,tap1,tap2 state=present
 '''
 
 
@@ -59,7 +69,7 @@ class OVSPort(object):
     def __init__(self, module):
         self.module = module
         self.bridge = module.params['bridge']
-        self.port = module.params['port']
+        self.ports = module.params['ports'] or [module.params['port']]
         self.state = module.params['state']
         self.timeout = module.params['timeout']
 
@@ -67,63 +77,61 @@ class OVSPort(object):
         '''Run ovs-vsctl command'''
         return self.module.run_command(['ovs-vsctl', '-t', str(self.timeout)] + command)
 
-    def exists(self):
-        '''Check if the port already exists'''
+    def existing(self):
+        '''Return the set of ports currently on the bridge'''
         rc, out, err = self._vsctl(['list-ports', self.bridge])
         if rc != 0:
             raise Exception(err)
-        return any(port.rstrip() == self.port for port in out.split('\n'))
-
-    def add(self):
-        '''Add the port'''
-        rc, _, err = self._vsctl(['add-port', self.bridge, self.port])
-        if rc != 0:
-            raise Exception(err)
-
-    def delete(self):
-        '''Remove the port'''
-        rc, _, err = self._vsctl(['del-port', self.bridge, self.port])
+        return set(port.rstrip() for port in out.split('\n') if port.rstrip())
+
+    def changes(self):
+        '''Return the ports to add and to delete'''
+        existing = self.existing()
+        if self.state == 'absent':
+            return [], [p for p in self.ports if p in existing]
+        return [p for p in self.ports if p not in existing], []
+
+    def apply(self, to_add, to_delete):
+        '''Add and remove ports in one ovs-vsctl transaction'''
+        command = []
+        for port in to_add:
+            command += ['--', 'add-port', self.bridge, port]
+        for port in to_delete:
+            command += ['--', 'del-port', self.bridge, port]
+        rc, _, err = self._vsctl(command)
         if rc != 0:
             raise Exception(err)
 
     def check(self):
         '''Run check mode'''
         try:
-            if self.state == 'absent' and self.exists():
-                changed = True
-            elif self.state == 'present' and not self.exists():
-                changed = True
-            else:
-                changed = False
+            to_add, to_delete = self.changes()
         except Exception, e:
             self.module.fail_json(msg=str(e))
-        self.module.exit_json(changed=changed)
+        self.module.exit_json(changed=bool(to_add or to_delete), added=to_add, deleted=to_delete)
 
     def run(self):
         '''Make the necessary changes'''
-        changed = False
         try:
-            if self.state == 'absent':
-                if self.exists():
-                    self.delete()
-                    changed = True
-            elif self.state == 'present':
-                if not self.exists():
-                    self.add()
-                    changed = True
+            to_add, to_delete = self.changes()
+            if to_add or to_delete:
+                self.apply(to_add, to_delete)
         except Exception, e:
             self.module.fail_json(msg=str(e))
-        self.module.exit_json(changed=changed)
+        self.module.exit_json(changed=bool(to_add or to_delete), added=to_add, deleted=to_delete)
 
 
 def main():
     module = AnsibleModule(
         argument_spec={
             'bridge': {'required': True},
-            'port': {'required': True},
+            'port': {'required': False},
+            'ports': {'required': False, 'type': 'list'},
             'state': {'default': 'present', 'choices': ['present', 'absent']},
             'timeout': {'default': 5, 'type': 'int'}
         },
+        required_one_of=[['port', 'ports']],
+        mutually_exclusive=[['port', 'ports']],
         supports_check_mode=True,
     )
 